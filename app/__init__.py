@@ -17,7 +17,11 @@ CORS(app)
 # APScheduler configuration
 scheduler = APScheduler()
 scheduler.init_app(app)
-scheduler.start()
+if app.config['RUN_SCHEDULER']:
+    scheduler.start()
+else:
+    # jobs added in this process are stored for the process running the scheduler
+    scheduler.scheduler.start(paused=True)
 
 # SQLAlchemy config
 db = SQLAlchemy(app)
@@ -6,9 +6,14 @@ import datetime
 from apscheduler.jobstores.base import ConflictingIdError
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_
-from .models import User, ScanJob, LinkCheck, ScheduledJob, PermissionedURL, Owner, Link, Exception
+from .models import User, ScanJob, LinkCheck, ScheduledJob, PermissionedURL, Owner, Link, Exception, WorkItem
 from . import app, scheduler, db
 from .link_check import LinkChecker, standardize_descheme_url
+from .async_crawl import AsyncLinkChecker
+from .sharding import ShardedLinkChecker, start_sharded_job
+from .globals import ASYNC_CRAWL, CHECKPOINT_STALE_SECONDS, USE_WORK_QUEUE, SCAN_SHARDS, WORK_POLL_SECONDS, \
+    INTERACTIVE_SCAN_PRIORITY, SCHEDULED_SCAN_PRIORITY, MAX_RESUMES
+from .work_queue import WorkQueue
 from .email import send_email
 from .auth import auth
 
@@ -68,7 +73,17 @@ def email_results(job):
 def scan(*args, **kwargs):
     with app.app_context():
         print('Scanning [{}]'.format(datetime.datetime.now().time()))
+        checker_class = AsyncLinkChecker if ASYNC_CRAWL else LinkChecker
+
+        # continue an interrupted job from its last checkpoint
+        resume_job_id = kwargs.pop('resume_job_id', None)
+        if resume_job_id is not None:
+            checker = checker_class.resume(ScanJob.query.get(resume_job_id), stopped=kwargs.pop('stopped', None))
+            return run_scan(checker, checker.scan_kwargs.get('email', False))
+
         email = kwargs.pop('email', False)
+        work_item_id = kwargs.pop('work_item_id', None)
+        shards = kwargs.pop('shards', SCAN_SHARDS)
 
         owner_id = kwargs.pop('owner_id')
         owner = Owner.query.filter(Owner.id == owner_id).first()
@@ -78,28 +93,175 @@ def scan(*args, **kwargs):
         user = User.query.filter(User.id == user_id).first()
         kwargs['user'] = user
 
-        checker = LinkChecker(*args, **kwargs)
+        # rescan incrementally from the last completed job for the same site
+        if kwargs.pop('incremental', False):
+            kwargs['previous_job'] = ScanJob.query.\
+                filter(ScanJob.root_url == standardize_descheme_url(kwargs['url'])).\
+                filter(ScanJob.user == user).\
+                filter(ScanJob.owner == owner).\
+                filter(ScanJob.status == 'completed').\
+                order_by(ScanJob.id.desc()).\
+                first()
+
+        if USE_WORK_QUEUE and shards > 1:
+            # each shard of the job is queued for a worker of its own, as urgently as the
+            # scan, in the same transaction as the job, so that a worker reclaiming the
+            # scan's item finds either the job with its shards queued or neither
+            job = start_sharded_job(kwargs['url'], user, owner, shards, commit=False)
+            priority = 0
+            if work_item_id is not None:
+                item = WorkItem.query.get(work_item_id)
+                item.scan_job_id = job.id
+                priority = item.priority
+            return enqueue_scan_shards(job, kwargs['url'], shards, email, kwargs.get('previous_job'), priority)
+
+        checker = checker_class(*args, **kwargs)
+        checker.scan_kwargs = dict(email=email)
+        if work_item_id is not None:
+            # a worker reclaiming the item resumes this job rather than starting over
+            WorkItem.query.get(work_item_id).scan_job_id = checker.job.id
+        # a scan resumed before its first checkpoint keeps its options and previous job
+        checker.checkpoint()
+        run_scan(checker, email)
+
+
+def run_scan(checker, email=False):
+    """Crawl with `checker`, mark its job completed and email its results if `email`.
+    If the crawl stops before its job is completed, its spill file is kept, for
+    the job to be resumed from its checkpoint"""
+    completed = False
+    try:
         checker.check_all_links_and_follow()
         checker.report_errors(lambda status: status == 404)
         checker.job.status='completed'
+        checker.job.checkpoint = None
         db.session.commit()
-        if email:
+        completed = True
+    finally:
+        checker.close(keep_spill_file=not completed)
+    if email:
+        print('Sending email')
+        email_results(checker.job)
+
+
+def enqueue_scan(priority=SCHEDULED_SCAN_PRIORITY, **kwargs):
+    """Queue a scan with `kwargs` for a worker process, with work queue `priority`"""
+    with app.app_context():
+        return WorkQueue().enqueue(
+            'scan', kwargs, priority, owner_id=int(kwargs['owner_id']), user_id=int(kwargs['user_id']))
+
+
+def run_scan_item(kwargs, item, stopped=None):
+    """Work queue handler: run the scan of work item `item`, resuming its job
+    if an earlier attempt started one, until it completes or `stopped` is set"""
+    if item.scan_job_id is not None:
+        shard_items = WorkItem.query.\
+            filter(WorkItem.scan_job_id == item.scan_job_id).\
+            filter(WorkItem.kind == 'scan_shard')
+        if shard_items.count():
+            # an earlier attempt sharded the job, whose shards run as items of their own
+            return
+        scan(resume_job_id=item.scan_job_id, stopped=stopped)
+    else:
+        scan(work_item_id=item.id, stopped=stopped, **kwargs)
+
+
+def enqueue_scan_shards(job, url, shards, email=False, previous_job=None, priority=0):
+    """Queue a work item for each of the `shards` shards of scan `job` of `url`,
+    with work queue `priority`. The items are committed together, with any
+    other changes pending, such as the job itself"""
+    queue = WorkQueue()
+    for shard in range(shards):
+        queue.enqueue('scan_shard', dict(
+            job_id=job.id,
+            url=url,
+            shard=shard,
+            shards=shards,
+            email=email,
+            previous_job_id=previous_job.id if previous_job is not None else None,
+        ), priority, scan_job_id=job.id, owner_id=job.owner_id, user_id=job.user_id, commit=False)
+    db.session.commit()
+
+
+def run_scan_shard_item(payload, item, stopped=None):
+    """Work queue handler: crawl one shard of a sharded scan until it runs out of
+    URLs. While other shards may yet find URLs for it, its item is queued again
+    to run after `WORK_POLL_SECONDS`, rather than holding on to its worker. The
+    last shard to finish completes the job and emails its results"""
+    job = ScanJob.query.get(payload['job_id'])
+    previous_job_id = payload['previous_job_id']
+    checker = ShardedLinkChecker(
+        payload['url'], job.user, job.owner, payload['shard'], payload['shards'], job, stopped=stopped,
+        previous_job=ScanJob.query.get(previous_job_id) if previous_job_id is not None else None)
+    try:
+        checker.check_all_links_and_follow()
+    finally:
+        checker.close()
+    if checker.finish_job():
+        checker.report_errors(lambda status: status == 404)
+        if payload['email']:
             print('Sending email')
-            email_results(checker.job)
+            email_results(job)
+    elif checker.urls_pending():
+        return WORK_POLL_SECONDS
+
+
+work_handlers = dict(scan=run_scan_item, scan_shard=run_scan_shard_item)
+
+
+def resume_stale_scans():
+    """Resume the scans left in progress by stopped workers: those whose last
+    checkpoint is older than `CHECKPOINT_STALE_SECONDS`. A job is resumed at
+    most `MAX_RESUMES` times, then marked failed. Jobs that were never
+    checkpointed aren't resumed, nor are scans run from the work queue, which
+    the queue retries within its own attempts"""
+    with app.app_context():
+        stale_time = datetime.datetime.utcnow() - datetime.timedelta(seconds=CHECKPOINT_STALE_SECONDS)
+        queued_jobs = db.session.query(WorkItem.scan_job_id).\
+            filter(WorkItem.scan_job_id != None)
+        jobs = ScanJob.query.\
+            filter(ScanJob.status == 'in progress').\
+            filter(ScanJob.checkpoint != None).\
+            filter(ScanJob.checkpoint_time < stale_time).\
+            filter(~ScanJob.id.in_(queued_jobs)).\
+            all()
+        for job in jobs:
+            resumes = job.resumes or 0
+            if resumes >= MAX_RESUMES:
+                print('Stale job {} failed after {} resumes'.format(job.id, resumes))
+                job.status = 'failed'
+                job.checkpoint = None
+                db.session.commit()
+                continue
+            print('Resuming stale job {}'.format(job.id))
+            # a fresh checkpoint time stops the job being resumed twice
+            job.checkpoint_time = datetime.datetime.utcnow()
+            job.resumes = resumes + 1
+            db.session.commit()
+            scheduler.add_job(
+                id='resume-{}'.format(job.id),
+                func=scan,
+                kwargs=dict(resume_job_id=job.id),
+                trigger='date',
+                replace_existing=True)
 
 
 def async_scan(url, user, owner=None):
     scan_record = ScheduledJob(root_url=url, owner=owner, user=user)
     db.session.add(scan_record)
     db.session.commit()
+    scan_kwargs = dict(
+        url=url,
+        user_id=str(user.id),
+        owner_id=str(owner.id),
+    )
+    if USE_WORK_QUEUE:
+        # on-demand scans are claimed ahead of recurring ones
+        return scan_record, enqueue_scan(priority=INTERACTIVE_SCAN_PRIORITY, **scan_kwargs)
     job_params_base = {
         'id': str(scan_record.id),
         'func': scan,
-        'kwargs': dict(
-            url=url,
-            user_id=str(user.id),
-            owner_id=str(owner.id),
-        ),
+        'kwargs': scan_kwargs,
         'trigger': 'date',
     }
     job_params = {**job_params_base}
@@ -112,12 +274,14 @@ def scheduled_scan(url, user, cron_params, owner=None):
     db.session.commit()
     job_params_base = {
         'id': str(scan_record.id),
-        'func': scan,
+        # with the work queue, the scheduler only queues each scan for a worker
+        'func': enqueue_scan if USE_WORK_QUEUE else scan,
         'kwargs': dict(
             url=url,
             user_id=str(user.id),
             owner_id=str(owner.id),
             email=True,
+            incremental=True,
         ),
         'trigger': 'cron',
     }
@@ -560,3 +724,23 @@ api.add_resource(HistoricalResults, "/results/historical")
 api.add_resource(LinkScanJob, "/link-scan/schedule")
 api.add_resource(UrlPermissions, "/permissions")
 api.add_resource(Owners, "/owners")
+
+# periodically resume the scans of stopped workers
+def schedule_resume_stale_scans():
+    """Schedule `resume_stale_scans` unless it is already stored, since replacing
+    it would postpone its next run each time a process starts"""
+    if scheduler.get_job('resume_stale_scans') is not None:
+        return
+    try:
+        scheduler.add_job(
+            id='resume_stale_scans',
+            func=resume_stale_scans,
+            trigger='interval',
+            seconds=CHECKPOINT_STALE_SECONDS)
+    except ConflictingIdError:
+        # another process scheduled it first
+        pass
+
+
+if app.config['RUN_SCHEDULER']:
+    schedule_resume_stale_scans()
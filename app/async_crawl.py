@@ -0,0 +1,164 @@
+"""Asyncio crawl engine"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .globals import CRAWL_CONCURRENCY, PARSE_PROCESSES, UNFOLLOWED_BATCH_SIZE
+from .link_check import LinkChecker, PageFetch, exception_result, parse_page, standardize_url
+from .politeness import BudgetExceeded
+
+
+class AsyncLinkChecker(LinkChecker):
+    """Link checker that crawls from an asyncio event loop, with up to
+    `concurrency` page fetches and link checks in flight at once.
+    Discovery rules, frontier order and persisted records are the same as
+    `LinkChecker`'s; all database access stays on the event loop's thread, while
+    the blocking requests run in a thread pool. With `parse_processes` > 0,
+    pages are parsed in a process pool, so that parsing scales with cores while
+    fetches continue"""
+    def __init__(self, url, user, owner, concurrency=CRAWL_CONCURRENCY, parse_processes=PARSE_PROCESSES, **kwargs):
+        super().__init__(url, user, owner, **kwargs)
+        self.parse_pool = ProcessPoolExecutor(parse_processes) if parse_processes > 0 else None
+        self.concurrency = concurrency
+        self._links_in_flight = set()
+        self._errors = []
+
+    def close(self, keep_spill_file=False):
+        """Also shut down the parse processes pooled by this checker"""
+        super().close(keep_spill_file)
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+
+    def check_all_links_and_follow(self, url=None):
+        """Check all links in all sub-pages of `url`"""
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.crawl(url or self.url))
+        finally:
+            loop.close()
+
+    async def crawl(self, url):
+        """Crawl all sub-pages of `url`, following pages concurrently in frontier order"""
+        self._loop = asyncio.get_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._requests = asyncio.Semaphore(self.concurrency)
+        self._frontier_changed = asyncio.Condition()
+        self._pages_in_progress = {}  # url -> depth of the pages being followed
+        self.queue_links([url], 0)
+        try:
+            # the site's robots.txt is requested once, off the event loop
+            await self.run_blocking(self.politeness.bucket, self.politeness.site_hostname)
+            # retries restored from a checkpoint are due at once
+            await asyncio.gather(*[
+                self.check_link_async(link)
+                for link in self.retries.pop_due()])
+            await asyncio.gather(*[
+                self.follow_pages()
+                for _ in range(self.concurrency)])
+            # the links left at the page limit stay in the checkpoint until checked
+            while self.frontier:
+                self.raise_if_stopped()
+                await asyncio.gather(*[
+                    self.check_link_async(link)
+                    for link in self.unfollowed_links(UNFOLLOWED_BATCH_SIZE)])
+                self.checkpoint_if_due()
+            self.flush()
+        finally:
+            self._executor.shutdown()
+        if self._errors:
+            raise self._errors[0]
+
+    async def follow_pages(self):
+        """Worker: check all links in pages popped from the frontier and queue their
+        internal links, until the frontier is exhausted, the page limit is exceeded
+        or the crawl is stopped"""
+        while True:
+            async with self._frontier_changed:
+                while not self.frontier and self._pages_in_progress:
+                    await self._frontier_changed.wait()
+                if not self.frontier or self.is_stopped() or self.page_limit_exceeded():
+                    self._frontier_changed.notify_all()
+                    return
+                url, depth = self.frontier.pop()
+                self.links_checked_and_followed.add(url)
+                self._pages_in_progress[url] = depth
+            try:
+                await self.check_all_links_async(url, depth)
+                if depth > 0:
+                    # pages other than the root were found as links, so record their check
+                    await self.check_link_async(url)
+            except Exception as exception:
+                print('Error while following {}'.format(url))
+                print(exception)
+                self._errors.append(exception)
+            async with self._frontier_changed:
+                del self._pages_in_progress[url]
+                self.checkpoint_if_due(self._pages_in_progress.items())
+                self._frontier_changed.notify_all()
+
+    async def run_blocking(self, func, *args):
+        """Run blocking `func` in the thread pool, bounded by the request semaphore"""
+        async with self._requests:
+            return await self._loop.run_in_executor(self._executor, func, *args)
+
+    def wait_turn(self, url):
+        """Requests wait their turn on the event loop, in `wait_turn_async`"""
+
+    async def wait_turn_async(self, url):
+        """Sleep until the politeness scheduler allows a request to `url`"""
+        delay = self.politeness.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def check_all_links_async(self, url, depth=0):
+        """Find all links within `url`, found `depth` links away from the root URL,
+        queue its internal links for following and check each link. Links that are
+        queued or being followed are left to be checked when they are followed"""
+        url_standardized = standardize_url(url)
+        print('Checking all links found in {}'.format(url_standardized))
+        try:
+            await self.wait_turn_async(url_standardized)
+            page = await self.run_blocking(self.fetch_page, url_standardized)
+        except BudgetExceeded as exception:
+            page = PageFetch(exception_result(exception), None, None, None, False)
+        self.record_page(url_standardized, page)
+        if page.not_modified:
+            internal_links, external_links = self.previous_links(url_standardized)
+        else:
+            internal_links, external_links = await self._loop.run_in_executor(
+                self.parse_pool or self._executor,
+                parse_page, page.html, url_standardized, self.url)
+
+        # persist source links
+        self.persist_links(internal_links, external_links, url_standardized)
+
+        # queue internal links for following and check links
+        async with self._frontier_changed:
+            self.queue_links(internal_links, depth + 1)
+            self._frontier_changed.notify_all()
+        await asyncio.gather(*[
+            self.check_link_async(link)
+            for link in internal_links + external_links
+            if not self.is_deferred(link)])
+        return internal_links
+
+    async def check_link_async(self, link):
+        """Request the resources specified by `link`, retrying transient failures,
+        and persist the results"""
+        if link in self._links_in_flight or self.is_checked(link):
+            return
+        self._links_in_flight.add(link)
+        try:
+            while True:
+                result = self.known_result(link)
+                if result is None:
+                    try:
+                        await self.wait_turn_async(link)
+                        result = await self.run_blocking(self.request_link, link)
+                    except BudgetExceeded as exception:
+                        result = exception_result(exception)
+                delay = self.retry_delay(link, result)
+                if delay is None:
+                    return self.record_link_check(link, result)
+                # other checks and pages carry on while this one waits
+                await asyncio.sleep(delay)
+        finally:
+            self._links_in_flight.discard(link)
@@ -0,0 +1,63 @@
+"""Cache of link check results shared by all scan jobs in a process"""
+import threading
+import time
+from collections import OrderedDict
+from .globals import RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_NEGATIVE_TTL
+
+
+def is_positive(result):
+    """Return True if link check `result` found the link working"""
+    response = result.get('response')
+    return response is not None and response < 400
+
+
+class ResultCache(object):
+    """Thread-safe cache of link check results, keyed on the checked URL.
+    Positive results expire after `ttl` seconds and negative results (error
+    responses and exceptions) after `negative_ttl`, so broken links are
+    re-verified sooner. Once `max_size` results are cached, the least recently
+    used are evicted. Each process has its own cache, `result_cache`: it isn't
+    shared between web and worker processes or nodes, so each process checks a
+    link once per TTL, and `clear` only empties this process's results"""
+    def __init__(self, max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL,
+                 negative_ttl=RESULT_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._results = OrderedDict()  # url -> (expiry time, result)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, url):
+        """Return the cached result for `url`, or None if missing or expired"""
+        with self._lock:
+            cached = self._results.get(url)
+            if cached is None:
+                return None
+            expiry, result = cached
+            if expiry < time.time():
+                del self._results[url]
+                return None
+            self._results.move_to_end(url)
+            return dict(result)
+
+    def put(self, url, result):
+        """Cache `result` for `url`"""
+        ttl = self.ttl if is_positive(result) else self.negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._results[url] = (time.time() + ttl, dict(result))
+            self._results.move_to_end(url)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        """Remove all cached results"""
+        with self._lock:
+            self._results.clear()
+
+
+result_cache = ResultCache()
@@ -0,0 +1,63 @@
+"""Link extraction: collect hrefs straight from lxml's HTML parser events"""
+from bs4 import UnicodeDammit
+from lxml import etree
+
+
+class HrefCollector(object):
+    """lxml parser target collecting the href of each anchor tag.
+    BeautifulSoup's lxml builder is driven by the same parser events, so the hrefs
+    collected match `soup.find_all('a')`, without building a tree"""
+    def __init__(self):
+        self.hrefs = []
+
+    def start(self, tag, attrib):
+        if tag == 'a' and 'href' in attrib:
+            self.hrefs.append(attrib['href'])
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.hrefs
+
+
+def decode_html(html):
+    """Decode `html` bytes as UTF-8, or else detect their encoding as BeautifulSoup does"""
+    if not isinstance(html, bytes):
+        return html
+    try:
+        return html.decode('utf-8')
+    except UnicodeDecodeError:
+        return UnicodeDammit(html, is_html=True).unicode_markup
+
+
+def unescape_href(href):
+    """Decode escape sequences in `href` as `bytes(href, "utf-8").decode("unicode_escape")`
+    does, skipping the round trip for ASCII hrefs without backslashes"""
+    if '\\' not in href:
+        try:
+            href.encode('ascii')
+            return href
+        except UnicodeEncodeError:
+            pass
+    return bytes(href, "utf-8").decode("unicode_escape")
+
+
+def extract_links(html):
+    """Get all hrefs in `html`"""
+    if not html:
+        return []
+    collector = HrefCollector()
+    parser = etree.HTMLParser(target=collector, strip_cdata=False, recover=True)
+    try:
+        parser.feed(decode_html(html))
+        hrefs = parser.close()
+    except etree.LxmlError:
+        hrefs = collector.hrefs
+    return [unescape_href(href) for href in hrefs]
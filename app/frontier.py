@@ -0,0 +1,71 @@
+"""Crawl frontier: the pages waiting to be followed, in the order to follow them"""
+import heapq
+import itertools
+from .interning import UrlTable
+
+
+def breadth_first(depth, inbound_links):
+    """Follow pages in the order they were discovered"""
+    return 0
+
+
+def shallowest_first(depth, inbound_links):
+    """Follow pages closest to the root URL first"""
+    return depth
+
+
+def most_linked_first(depth, inbound_links):
+    """Follow the pages with the most inbound links first"""
+    return -inbound_links
+
+
+class Frontier(object):
+    """Priority queue of pages to follow.
+    Pages are popped in ascending order of `priority(depth, inbound_links)`, ties
+    broken by discovery order, so the default priority gives a breadth-first crawl.
+    Pushing a page that is already queued counts another inbound link to it and,
+    if that changes its priority, re-queues it; the stale heap entry is skipped on pop.
+    Pages are held as their IDs in the URL table `urls`"""
+    def __init__(self, priority=breadth_first, urls=None):
+        self.priority = priority
+        self.urls = urls if urls is not None else UrlTable()
+        self._heap = []
+        self._queued = {}  # url ID -> (priority, discovery order, depth, inbound links)
+        self._discovery_order = itertools.count()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def __contains__(self, url):
+        return self.urls.id(url) in self._queued
+
+    def entries(self):
+        """Return the queued pages in discovery order, as tuples: (`url`, `depth`, `inbound_links`)"""
+        queued = sorted(self._queued.items(), key=lambda item: item[1][1])
+        return [(self.urls.url(url), depth, inbound_links) for url, (_, _, depth, inbound_links) in queued]
+
+    def push(self, url, depth=0, inbound_links=1):
+        """Queue `url`, found `depth` links away from the root URL, counting
+        `inbound_links` more links to it"""
+        url = self.urls.intern(url)
+        links_found = inbound_links
+        if url in self._queued:
+            _priority, order, queued_depth, inbound_links = self._queued[url]
+            depth = min(depth, queued_depth)
+            inbound_links += links_found
+        else:
+            _priority, order = None, next(self._discovery_order)
+        priority = self.priority(depth, inbound_links)
+        self._queued[url] = (priority, order, depth, inbound_links)
+        if priority != _priority:
+            heapq.heappush(self._heap, (priority, order, url))
+
+    def pop(self):
+        """Remove and return the next page to follow as a tuple: (`url`, `depth`)"""
+        while self._heap:
+            priority, order, url = heapq.heappop(self._heap)
+            queued = self._queued.get(url)
+            if queued is not None and queued[:2] == (priority, order):
+                del self._queued[url]
+                return self.urls.url(url), queued[2]
+        raise IndexError('pop from an empty frontier')
@@ -1,3 +1,51 @@
 """Set global statics"""
 GET_TIMEOUT = 10
-PAGE_LIMIT = 5000
\ No newline at end of file
+PAGE_LIMIT = 5000
+CHECK_WORKERS = 16  # concurrent link checks per scan
+HOST_CONCURRENCY = 4  # concurrent requests per host
+CRAWL_CONCURRENCY = 32  # concurrent requests per scan with the asyncio engine
+ASYNC_CRAWL = False  # scan with the asyncio engine
+POOL_CONNECTIONS = 100  # hosts with pooled connections per scan
+POOL_MAXSIZE = HOST_CONCURRENCY  # pooled connections per host
+FLUSH_ROWS = 500  # buffered records per bulk insert
+FLUSH_SECONDS = 5  # max seconds between bulk inserts
+PARSE_PROCESSES = 0  # processes parsing pages per asyncio scan; 0 parses in its thread pool
+USE_RESULT_CACHE = True  # reuse external link check results across jobs
+RESULT_CACHE_SIZE = 100000  # cached link check results per process
+RESULT_CACHE_TTL = 24 * 60 * 60  # seconds to reuse a working link's result
+RESULT_CACHE_NEGATIVE_TTL = 60 * 60  # seconds to reuse a broken link's result
+HEAD_FIRST = True  # check links with HEAD requests, falling back to GET
+HEAD_UNSUPPORTED_HOSTS = ('linkedin.com', 'amazon.com')  # hosts answering HEAD wrongly
+MAX_PARSE_BYTES = 10 * 1024 * 1024  # largest page body parsed for links
+HOST_RATE = 10  # requests per second per host, unless robots.txt sets a crawl delay
+HOST_BURST = 20  # requests per host allowed in a burst
+REQUEST_BUDGET = 100000  # requests per scan
+MIN_TIMEOUT = 3  # seconds; floor for timeouts adapted to a host's latency
+CIRCUIT_BREAKER_FAILURES = 3  # consecutive failed connections before a host's links fail without a request
+MAX_ATTEMPTS = 3  # requests per link, including retries of transient failures
+RETRY_BACKOFF = 1  # seconds; base of the exponential backoff between attempts
+RETRY_MAX_DELAY = 30  # seconds; longest wait before a retry, including a server's Retry-After
+RETRY_STATUSES = (429, 502, 503, 504)  # responses retried as transient failures
+RETRY_EXCEPTIONS = ('ReadTimeout', 'ChunkedEncodingError')  # exceptions retried as transient failures
+URL_CACHE_SIZE = 50000  # URLs memoized by each normalization function
+SPILL_TO_DISK = False  # keep the frontier and visited sets in a local SQLite file, for very large crawls
+SPILL_DIR = None  # directory for the SQLite files; None for the system temporary directory
+SPILL_HOT_SIZE = 10000  # URLs kept in memory by each disk-backed frontier and visited set
+BLOOM_CAPACITY = 1000000  # URLs per Bloom filter before its false positive rate exceeds 1%
+CHECKPOINT_SECONDS = 60  # interval between checkpoints of a scan's progress
+CHECKPOINT_STALE_SECONDS = 1800  # age of an in-progress scan's last checkpoint before it is resumed elsewhere
+UNFOLLOWED_BATCH_SIZE = 100  # links left unfollowed at the page limit checked between checkpoints
+MAX_RESUMES = 3  # times a stale scan is resumed before it is marked failed
+USE_WORK_QUEUE = False  # run scans on worker processes through the database work queue, not in the web process
+WORK_QUEUE = 'scans'  # name of the work queue for scans
+WORKER_THREADS = 4  # items each worker process runs at once
+LEASE_SECONDS = 300  # seconds a claimed work item is leased for without a heartbeat
+HEARTBEAT_SECONDS = 60  # interval between a worker's lease extensions
+WORK_POLL_SECONDS = 5  # wait before polling an empty work queue again
+WORK_MAX_ATTEMPTS = 3  # attempts per work item, including those whose worker stopped
+SCAN_SHARDS = 1  # worker processes sharing each scan's crawl, when scans run from the work queue
+SHARD_BATCH_SIZE = 100  # URLs a shard claims at once
+INTERACTIVE_SCAN_PRIORITY = 10  # work queue priority of on-demand scans
+SCHEDULED_SCAN_PRIORITY = 0  # work queue priority of recurring scans
+OWNER_SCAN_QUOTA = 2  # queued scans an owner may have running at once, unless the owner sets its own quota
+USER_SCAN_QUOTA = 8  # queued scans a user may have running at once, across all of its owners
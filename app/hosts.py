@@ -0,0 +1,71 @@
+"""Per-host health within a job: adaptive timeouts and a circuit breaker for dead hosts"""
+import threading
+import requests
+from .urls import parse_url
+from .globals import GET_TIMEOUT, MIN_TIMEOUT, CIRCUIT_BREAKER_FAILURES
+
+
+def is_connection_failure(exception):
+    """Return True if `exception` shows the host could not be reached"""
+    return isinstance(exception, requests.exceptions.ConnectionError) and \
+        not isinstance(exception, requests.exceptions.SSLError)
+
+
+class HostHealth(object):
+    """Tracks the latency and connection failures of each host requested in a job.
+    Timeouts adapt to each host's latency, as TCP's retransmission timeout does:
+    the smoothed latency plus four times its variation, between `min_timeout` and
+    `max_timeout`. Once a host has failed to connect `max_failures` times in a
+    row, its circuit opens and its remaining links fail without a request"""
+    def __init__(self, max_failures=CIRCUIT_BREAKER_FAILURES, min_timeout=MIN_TIMEOUT, max_timeout=GET_TIMEOUT):
+        self.max_failures = max_failures
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._latency = {}  # host -> (smoothed latency, latency variation)
+        self._failures = {}  # host -> (consecutive connection failures, last exception)
+        self._lock = threading.Lock()
+
+    def timeout(self, url):
+        """Return the timeout for a request to `url`"""
+        latency = self._latency.get(parse_url(url).netloc)
+        if latency is None:
+            return self.max_timeout
+        smoothed, variation = latency
+        return min(self.max_timeout, max(self.min_timeout, smoothed + 4 * variation))
+
+    def record_latency(self, url, seconds):
+        """Record a response from `url` after `seconds`"""
+        host = parse_url(url).netloc
+        with self._lock:
+            self._failures.pop(host, None)
+            if host not in self._latency:
+                self._latency[host] = (seconds, seconds / 2)
+            else:
+                smoothed, variation = self._latency[host]
+                variation = 0.75 * variation + 0.25 * abs(smoothed - seconds)
+                smoothed = 0.875 * smoothed + 0.125 * seconds
+                self._latency[host] = (smoothed, variation)
+
+    def record_failure(self, url, exception, seconds):
+        """Record a request to `url` failing with `exception` after `seconds`"""
+        if isinstance(exception, requests.exceptions.ReadTimeout):
+            # the host is slower than its timeout allowed for, so back it off
+            self.record_latency(url, 2 * seconds)
+        elif is_connection_failure(exception):
+            host = parse_url(url).netloc
+            with self._lock:
+                failures, _ = self._failures.get(host, (0, None))
+                self._failures[host] = (failures + 1, exception)
+
+    def circuit_open_result(self, url):
+        """Return the fields of a failed `LinkCheck` record for `url` if its host's
+        circuit is open, else None"""
+        host = parse_url(url).netloc
+        failures, exception = self._failures.get(host, (0, None))
+        if failures < self.max_failures:
+            return None
+        return dict(
+            note='Not requested: circuit open after {} failed connections to {} in this job. {}'.format(
+                failures, host, exception),
+            exception=type(exception).__name__,
+        )
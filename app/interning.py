@@ -0,0 +1,118 @@
+"""Per-job URL interning: each URL is stored once and referred to by integer ID"""
+import threading
+from array import array
+
+
+class UrlTable(object):
+    """Maps URLs to consecutive integer IDs and back. The URLs are stored once,
+    UTF-8 encoded end to end in a single bytearray indexed by an array of
+    offsets, and are looked up in an open-addressing hash table of IDs, also an
+    array, so that no Python object is kept per URL"""
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array('I', [0])
+        self._hashes = array('I')  # ID -> low 32 bits of the hash of its URL
+        self._slots = array('i', [-1]) * 8  # hash table of IDs, -1 for empty slots
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, url):
+        return self.id(url) is not None
+
+    def url(self, url_id):
+        """Return the URL with ID `url_id`"""
+        return self._data[self._offsets[url_id]:self._offsets[url_id + 1]].decode('utf-8', 'surrogatepass')
+
+    def _find(self, url, url_hash):
+        """Return the slot holding `url`, or the empty slot for it, and its ID or None"""
+        mask = len(self._slots) - 1
+        slot = url_hash & mask
+        while True:
+            url_id = self._slots[slot]
+            if url_id == -1:
+                return slot, None
+            if self._hashes[url_id] == url_hash and self.url(url_id) == url:
+                return slot, url_id
+            slot = (slot + 1) & mask
+
+    def id(self, url):
+        """Return the ID of `url`, or None if it hasn't been interned"""
+        return self._find(url, hash(url) & 0xFFFFFFFF)[1]
+
+    def intern(self, url):
+        """Return the ID of `url`, adding it to the table if necessary"""
+        url_hash = hash(url) & 0xFFFFFFFF
+        with self._lock:
+            slot, url_id = self._find(url, url_hash)
+            if url_id is not None:
+                return url_id
+            url_id = len(self)
+            self._data += url.encode('utf-8', 'surrogatepass')
+            self._offsets.append(len(self._data))
+            self._hashes.append(url_hash)
+            self._slots[slot] = url_id
+            if 2 * len(self) > len(self._slots):
+                self._resize()
+            return url_id
+
+    def _resize(self):
+        """Double the hash table, keeping it at most half full"""
+        self._slots = array('i', [-1]) * (2 * len(self._slots))
+        mask = len(self._slots) - 1
+        for url_id, url_hash in enumerate(self._hashes):
+            slot = url_hash & mask
+            while self._slots[slot] != -1:
+                slot = (slot + 1) & mask
+            self._slots[slot] = url_id
+
+
+class UrlSet(object):
+    """Set of URLs interned in `urls`, stored as a bitmap of their IDs"""
+    def __init__(self, urls, iterable=()):
+        self.urls = urls
+        self._bits = bytearray()
+        self._len = 0
+        self.update(iterable)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, url):
+        return self.has_id(self.urls.id(url))
+
+    def __iter__(self):
+        for byte_index, byte in enumerate(self._bits):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield self.urls.url(byte_index * 8 + bit)
+
+    def __eq__(self, other):
+        return set(self) == set(other)
+
+    def __repr__(self):
+        return '<UrlSet of {} URLs>'.format(len(self))
+
+    def has_id(self, url_id):
+        """Return True if the URL with ID `url_id` is in the set"""
+        if url_id is None or url_id >> 3 >= len(self._bits):
+            return False
+        return bool(self._bits[url_id >> 3] & (1 << (url_id & 7)))
+
+    def add(self, url):
+        """Add `url` to the set"""
+        url_id = self.urls.intern(url)
+        if self.has_id(url_id):
+            return
+        if url_id >> 3 >= len(self._bits):
+            self._bits.extend(bytes((url_id >> 3) + 1 - len(self._bits)))
+        self._bits[url_id >> 3] |= 1 << (url_id & 7)
+        self._len += 1
+
+    def update(self, urls):
+        """Add each URL in iterable `urls` to the set"""
+        for url in urls:
+            self.add(url)
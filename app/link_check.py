@@ -1,271 +1,705 @@
 """Recursive link checker"""
 import argparse
 import requests
-from requests.compat import urljoin, urlparse
-from bs4 import BeautifulSoup
 import datetime
-from .globals import GET_TIMEOUT, PAGE_LIMIT
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from .globals import GET_TIMEOUT, PAGE_LIMIT, CHECK_WORKERS, HOST_CONCURRENCY, \
+    USE_RESULT_CACHE, HEAD_FIRST, HEAD_UNSUPPORTED_HOSTS, MAX_PARSE_BYTES, REQUEST_BUDGET, MAX_ATTEMPTS, \
+    SPILL_TO_DISK, CHECKPOINT_SECONDS, UNFOLLOWED_BATCH_SIZE
+from .cache import result_cache
+from .extract import extract_links
+from .urls import web_extensions, parse_url, get_base_url, get_hostname, points_to_self, remove_web_extensions, \
+    is_internal_link, is_internal_to_base, ensure_protocol, prepend_if_relative, join_url, is_flat_file, \
+    standardize_url, standardize_descheme_url
+from .frontier import Frontier, breadth_first
+from .interning import UrlTable, UrlSet
+from .spill import SpillStore, DiskFrontier, DiskUrlSet
+from .sessions import scan_session
+from .persistence import BufferedWriter
+from .politeness import PolitenessScheduler, BudgetExceeded
+from .hosts import HostHealth
+from .retries import RetryPolicy, RetryQueue, parse_retry_after
 from . import app, db, scheduler
-from .models import Link, LinkCheck, ScanJob, ScheduledJob
+from .models import Link, LinkCheck, Page, ScanJob, ScheduledJob
 
 
 headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
-web_extensions = ('html', 'htm', 'aspx', 'php', 'asp', 'cfm', 'xml')
+web_content_types = ('text/html', 'application/xhtml+xml', 'text/xml', 'application/xml')
 
 
-def get_all_links(url):
-    """Get all hrefs in the HTML of a given URL"""
+class CrawlStopped(Exception):
+    """The crawl was asked to stop before it finished"""
+
+
+def get_all_links(url, session=None):
+    """Get all hrefs in the HTML of a given URL, requested through `session` if given"""
     if is_flat_file(url):
         return []
     try:
-        response = requests.get(url, timeout=GET_TIMEOUT, verify=False, headers=headers)
+        response = (session or requests).get(
+            url, timeout=GET_TIMEOUT, verify=False, headers=headers, stream=True)
+        html = read_html(response)
     except requests.exceptions.RequestException as e:
         print('Error while getting links in {}'.format(url))
         print(e)
         return []
-    html = response.content
-    soup = BeautifulSoup(html, 'lxml')
-    return [
-        bytes(a['href'], "utf-8").decode("unicode_escape")
-        for a in soup.find_all('a')
-        if a.has_attr('href')]
-
-
-def get_base_url(url):
-    """Strip the scheme and trailing slashes from the URL"""
-    if (url.startswith('http')) and ('//' in url):
-        u = urlparse(url)
-        url_root = u.netloc + u.path
-    else:
-        url_root = url
-    url_stripped = url_root[:-1] if url_root.endswith('/') else url_root
-    return url_stripped
-
-
-def get_hostname(url):
-    """strip the path and query string from the url"""
-    u = urlparse(url)
-    return '{}://{}'.format(u.scheme, u.hostname)
-
-
-def points_to_self(link, url_self):
-    """Return true IFF `link` points to `url_self`"""
-    if link == '/':
-        return True
-    if get_base_url(link) == get_base_url(url_self):
-        return True
-    return False
-
-
-def remove_web_extensions(link):
-    """ Remove web extensions (e.g., html, asp) from link URL
-    """
-    link_no_web_extensions = link
-    for extension in web_extensions:
-        link_no_web_extensions = link_no_web_extensions.replace('.' + extension, '')
-    return link_no_web_extensions
+    return extract_links(html)
 
 
-def is_internal_link(link, reference_url):
-    """Return true IFF `link` is a sub-component of `reference_url`"""
-    if link.startswith('//'):
-        return False
-    if link.startswith('/') or link.startswith('#') or link.startswith('.'):
-        return True
-    if get_base_url(link).startswith(get_base_url(reference_url)):
-        return True
-    link_no_web_extensions = remove_web_extensions(link)
-    if '.' not in link_no_web_extensions:
-        return True
-    return False
-
-
-def ensure_protocol(url, protocol='http'):
-    if urlparse(url).scheme:
-        return url
-    if url.startswith('javascript:') or url.startswith('mailto:'):
-        return url
-    if url.startswith('//'):
-        return protocol + ':' + url
-    return protocol + '://' + url
-
-
-def prepend_if_relative(url, url_base, keep_anchors=False):
-    """Standardize `url` by prepending it with the hostname if relative"""
-    if url.startswith('javascript:') or url.startswith('mailto:'):
-        return url
-    url_joined = urljoin(standardize_url(url_base, True), url)
-    if not keep_anchors:
-        u = urlparse(url_joined)
-        return '{}://{}{}'.format(u.scheme, u.netloc, u.path)
-    return url_joined
+def read_html(response, max_bytes=MAX_PARSE_BYTES):
+    """Read the body of streamed `response` to parse it for links. Returns None,
+    without downloading the body, if its Content-Type isn't a web page type, and
+    stops reading and returns None once the body exceeds `max_bytes`"""
+    try:
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and content_type not in web_content_types:
+            return None
+        content_length = response.headers.get('Content-Length', '')
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            return None
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_bytes:
+                print('Not parsing {}: body exceeds {:,} bytes'.format(response.url, max_bytes))
+                return None
+        return b''.join(chunks)
+    finally:
+        response.close()
+
+
+# The outcome of requesting a page: fields of its `LinkCheck` record, its body to
+# parse for links (or None), its validators for conditional requests, and whether
+# it was not modified since the previous job
+PageFetch = namedtuple('PageFetch', ['result', 'html', 'etag', 'last_modified', 'not_modified'])
+
+
+def exception_result(exception):
+    """Return the `LinkCheck` fields describing a failed request"""
+    return dict(
+        note=str(exception),
+        exception=type(exception).__name__,
+    )
 
 
 def group_links_internal_external(links, url):
     """Split list `links` into internal and external links.
     Returns a tupple: (`internal_links`, `external_links`)
     """
-    internal_links = []
-    external_links = []
-    for link in links:
-        link = link.replace('"', '').replace("'", '')
-        if is_internal_link(link, url):
-            internal_links.append(standardize_url(prepend_if_relative(link, url)))
-        else:
-            external_links.append(ensure_protocol(link.strip()))
-    return internal_links, external_links
+    # every internal link is under the empty root
+    return group_links_under_root(links, url, '')
 
 
-def is_flat_file(url):
-    """Return True if `url` points to a (potentially large) flat file"""
-    # strip url args:
-    u = urlparse(url)
-    url = '{}://{}{}'.format(u.scheme, u.netloc, u.path)
-    if not u.path:
-        return False
-
-    if '.' not in u.path:
-        return False
-
-    file_type = u.path.split('.')[-1]
-    if file_type in web_extensions:
-        return False
-
-    return True
-
-
-def standardize_url(url, keep_scheme=False):
-    """Standardize `url` string formatting by removing anchors and trailing slashes,
-    and by prepending schemas
+def group_links_under_root(links, url, root_url):
+    """Split list `links` found in `url` into internal links under `root_url`,
+    which are followed, and external links, which are only checked.
+    Everything derived from `url` is computed once, and links repeated in
+    the page, such as navigation links, are only classified once.
+    Returns a tupple: (`internal_links`, `external_links`)
     """
+    reference_base = get_base_url(url)
+    join_base = standardize_url(url, True)
+    internal_links = []
+    external_links = []
+    # links above the root, which are checked but whose children we don't want to scan
+    above_root_links = []
+    classified = {}  # link -> (group, standardized link)
+    for link in links:
+        if link not in classified:
+            link_unquoted = link.replace('"', '').replace("'", '')
+            if is_internal_to_base(link_unquoted, reference_base):
+                link_standardized = standardize_url(join_url(link_unquoted, join_base))
+                group = internal_links if link_standardized.startswith(root_url) else above_root_links
+            else:
+                link_standardized = ensure_protocol(link_unquoted.strip())
+                group = external_links
+            classified[link] = (group, link_standardized)
+        group, link_standardized = classified[link]
+        group.append(link_standardized)
+    return internal_links, external_links + above_root_links
 
-    # special case
-    if url.startswith('javascript:') or url.startswith('mailto:'):
-        return url
-
-    # prepend scheme if necessary
-    if url.startswith('//'):
-        url = 'http:' + url
-    elif '.' in urlparse(url).path.split('/')[-1] and not url.startswith('/'):
-        url = ensure_protocol(url)
 
-    # internal links
-    u_dummy = urlparse(urljoin('http://dummy.com/dummy_path', url))
-    if u_dummy.netloc == 'dummy.com':
-        return url
+def parse_page(html, url, root_url):
+    """Extract the links in page `url` from its body `html` and group them with
+    `group_links_under_root`. Module level so that it can run in a process pool"""
+    if not html:
+        return [], []
+    return group_links_under_root(extract_links(html), url, root_url)
 
-    # external links
-    u = urlparse(ensure_protocol(url))
-    scheme = u.scheme.replace('https', 'http') if not keep_scheme else u.scheme
-    return '{}://{}{}'.format(scheme, u.netloc, u.path).strip()
 
-def standardize_descheme_url(url):
-    url_standardized = standardize_url(url)
-    u = urlparse(ensure_protocol(url_standardized))
-    return '{}{}'.format(u.netloc, u.path)
+def is_head_unsupported_host(hostname):
+    """Return True if `hostname` is known to answer HEAD requests wrongly"""
+    return any(
+        hostname == host or hostname.endswith('.' + host)
+        for host in HEAD_UNSUPPORTED_HOSTS)
 
 
 class LinkChecker(object):
-    """Link checker module, initialized with the root URL of the webiste to scan"""
-    def __init__(self, url, user, owner):
-        self.links_checked_and_followed = set()
+    """Link checker module, initialized with the root URL of the webiste to scan.
+    Up to `workers` links are checked concurrently, with at most `host_concurrency`
+    requests in flight to any single host; `workers=1` checks links serially.
+    Pages are followed in the order given by `priority` (see `frontier`).
+    All requests go through the checker's pooled `session`; call `close` when done.
+    Pages are parsed for links inline, between their fetch and their link checks.
+    Given a `previous_job` for the same site, pages are requested conditionally
+    and the links of unmodified pages are reused from that job.
+    Results for links outside the site are shared with other jobs in the same
+    process through `result_cache`; `use_cache=False` bypasses cached results.
+    With `head_first`, links are checked with a HEAD request, falling back to GET
+    for hosts that reject HEAD.
+    With `spill_to_disk`, the frontier and visited sets are kept in a local SQLite
+    file, with only their most recent URLs in memory; the file is committed at
+    each checkpoint, and reopened if the crawl is resumed on the same node.
+    The crawl's progress is checkpointed to its job every `checkpoint_seconds`;
+    given the `job` of an interrupted scan, the crawl continues from its last
+    checkpoint (see `resume`).
+    Given a `stopped` event, the crawl stops between pages once it is set,
+    raising `CrawlStopped`, for instance when its worker loses the lease on its
+    work item to another worker; nothing more is saved, since the job is
+    continued elsewhere"""
+    def __init__(self, url, user, owner, workers=CHECK_WORKERS, host_concurrency=HOST_CONCURRENCY,
+                 priority=breadth_first, previous_job=None,
+                 use_cache=USE_RESULT_CACHE, head_first=HEAD_FIRST, request_budget=REQUEST_BUDGET,
+                 max_attempts=MAX_ATTEMPTS, spill_to_disk=SPILL_TO_DISK, checkpoint_seconds=CHECKPOINT_SECONDS,
+                 job=None, stopped=None):
+        self.use_cache = use_cache
+        self.head_first = head_first
+        self.head_supported = {}  # host -> whether it answers HEAD requests in this job
+        self.session = scan_session(headers, pool_maxsize=max(host_concurrency, 1))
+        # a stopped crawl's spill file, if it is on this node, holds its progress
+        spill_path = json.loads(job.checkpoint).get('spill_path') if job is not None and job.checkpoint else None
+        if spill_to_disk or spill_path is not None:
+            self.spill_store = SpillStore(path=spill_path)
+            self.links_checked_and_followed = DiskUrlSet(self.spill_store, 'followed')
+            self.frontier = DiskFrontier(self.spill_store, priority)
+            self.links_checked = DiskUrlSet(self.spill_store, 'checked')
+        else:
+            self.spill_store = None
+            self.urls = UrlTable()
+            self.links_checked_and_followed = UrlSet(self.urls)
+            self.frontier = Frontier(priority, self.urls)
+            self.links_checked = UrlSet(self.urls)
+        self.page_results = {}  # followed page -> fields of its `LinkCheck` record, until it is recorded
+        self.writer = BufferedWriter()
         self.url = ensure_protocol(standardize_url(url))
-        self.job = ScanJob(
-            root_url=standardize_descheme_url(self.url),
-            start_time=datetime.datetime.utcnow(),
-            user=user,
-            status='in progress',
-            owner=owner)
-        db.session.add(self.job)
-        db.session.commit()
-
-    def check_link(self, link):
-        """Request the resources specified by `link` and persist the results"""
-        link_standardized = link
-        link_record_base = dict(
-            url_raw=link,
-            url=link_standardized,
-            job=self.job,
+        self.politeness = PolitenessScheduler(self.url, self.session, budget=request_budget)
+        self.hosts = HostHealth()
+        self.retry_policy = RetryPolicy(max_attempts)
+        self.retries = RetryQueue()
+        self.attempts = {}  # link -> failed attempts so far, while it waits to be retried
+        self.workers = workers
+        self.host_concurrency = host_concurrency
+        self._host_semaphores = {}
+        self._host_semaphores_lock = threading.Lock()
+        self.checkpoint_seconds = checkpoint_seconds
+        self.last_checkpoint = time.time()
+        self.scan_kwargs = {}  # options of the `scan` running this checker, checkpointed for resuming it
+        self.stopped = stopped
+        if job is None:
+            self.job = ScanJob(
+                root_url=standardize_descheme_url(self.url),
+                start_time=datetime.datetime.utcnow(),
+                user=user,
+                status='in progress',
+                owner=owner)
+            db.session.add(self.job)
+            db.session.commit()
+        else:
+            self.job = job
+        self.previous_job = previous_job
+        self.previous_pages = {}
+        if previous_job is not None:
+            self.load_previous_pages()
+        if job is not None:
+            self.restore_checkpoint()
+
+    @classmethod
+    def resume(cls, job, **kwargs):
+        """Return a checker continuing interrupted scan `job` from its last checkpoint"""
+        checkpoint = json.loads(job.checkpoint) if job.checkpoint else {}
+        previous_job_id = checkpoint.get('previous_job_id')
+        if previous_job_id is not None:
+            kwargs['previous_job'] = ScanJob.query.get(previous_job_id)
+        return cls(checkpoint.get('url', job.root_url), job.user, job.owner, job=job, **kwargs)
+
+    def checkpoint(self, pages_in_progress=()):
+        """Save the crawl's progress to its job, after persisting the records so far.
+        Pages in `pages_in_progress`, as tuples (`url`, `depth`), are saved to be
+        followed again. Links already checked aren't saved, since they are
+        loaded from the job's `LinkCheck` records"""
+        self.flush()
+        pages_in_progress = dict(pages_in_progress)
+        checkpoint = dict(
+            url=self.url,
+            page_results={
+                url: result for url, result in self.page_results.items()
+                if url not in self.links_checked and url not in pages_in_progress},
+            retries=list(self.retries),
+            requests_reserved=self.politeness.requests_reserved,
+            previous_job_id=self.previous_job.id if self.previous_job is not None else None,
+            scan_kwargs=self.scan_kwargs,
         )
-        already_checked = LinkCheck.query.\
-            filter(LinkCheck.job == self.job).\
-            filter(LinkCheck.url == link_standardized).\
-            count() > 0
-        if already_checked:
+        if self.spill_store is None:
+            checkpoint.update(
+                frontier=[[url, depth, 1] for url, depth in pages_in_progress.items()] +
+                [list(entry) for entry in self.frontier.entries()],
+                followed=[url for url in self.links_checked_and_followed if url not in pages_in_progress])
+        else:
+            # the spill file holds the followed set and the spilled frontier, so
+            # only the pages held in memory are saved with the checkpoint
+            checkpoint.update(
+                spill_path=self.spill_store.path,
+                in_progress=[[url, depth] for url, depth in pages_in_progress.items()],
+                hot_frontier=self.frontier.hot_entries())
+            self.spill_store.commit()
+        self.job.checkpoint = json.dumps(checkpoint)
+        self.job.checkpoint_time = datetime.datetime.utcnow()
+        db.session.commit()
+        self.last_checkpoint = time.time()
+
+    def checkpoint_if_due(self, pages_in_progress=()):
+        """Checkpoint the crawl if `checkpoint_seconds` have passed since the last checkpoint"""
+        if time.time() - self.last_checkpoint >= self.checkpoint_seconds:
+            self.checkpoint(pages_in_progress)
+
+    def restore_checkpoint(self):
+        """Restore the crawl's progress from its job's last checkpoint, if any, and
+        load the links already checked"""
+        self.load_links_checked()
+        checkpoint = json.loads(self.job.checkpoint) if self.job.checkpoint else None
+        if checkpoint is None:
+            self.delete_unfollowed_pages()
             return
+        if checkpoint.get('spill_path') is None:
+            self.links_checked_and_followed.update(checkpoint['followed'])
+            for url, depth, inbound_links in checkpoint['frontier']:
+                self.frontier.push(url, depth, inbound_links)
+        elif self.spill_store.path == checkpoint['spill_path']:
+            for url, depth in checkpoint['in_progress']:
+                self.links_checked_and_followed.discard(url)
+            self.frontier.restore(checkpoint['hot_frontier'])
+            for url, depth in checkpoint['in_progress']:
+                self.frontier.push(url, depth)
         else:
+            print('Spill file {} not found: job {} starts again from its root URL'.format(
+                checkpoint['spill_path'], self.job.id))
+        self.delete_unfollowed_pages()
+        self.page_results.update(checkpoint['page_results'])
+        for link in checkpoint['retries']:
+            if not self.is_checked(link):
+                self.retries.push(link, 0)
+        self.politeness.requests_reserved = checkpoint['requests_reserved']
+        self.scan_kwargs = checkpoint['scan_kwargs']
+        print('Resuming job {} with {} pages followed and {} queued'.format(
+            self.job.id, len(self.links_checked_and_followed), len(self.frontier)))
+
+    def delete_unfollowed_pages(self, chunk_size=500):
+        """Delete the `Link` and `Page` records of the pages followed since the last
+        checkpoint, since they are followed again"""
+        self.flush()
+        for model, url_column in ((Link, Link.source_url), (Page, Page.url)):
+            urls = [
+                row[0] for row in
+                db.session.query(url_column).filter(model.job_id == self.job.id).distinct()
+                if row[0] not in self.links_checked_and_followed]
+            for start in range(0, len(urls), chunk_size):
+                model.query.\
+                    filter(model.job_id == self.job.id).\
+                    filter(url_column.in_(urls[start:start + chunk_size])).\
+                    delete(synchronize_session=False)
+            db.session.commit()
+
+    def close(self, keep_spill_file=False):
+        """Release the connections pooled by this checker, and close its spilled
+        frontier and visited sets, deleting their file unless `keep_spill_file`,
+        for a crawl to be resumed from its checkpoint"""
+        self.session.close()
+        if self.spill_store is not None:
+            self.spill_store.close(remove=not keep_spill_file)
+            self.spill_store = None
+
+    def host_semaphore(self, link):
+        """Return the semaphore capping concurrent requests to the host of `link`"""
+        host = parse_url(link).netloc
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.host_concurrency)
+            return self._host_semaphores[host]
+
+    def wait_turn(self, url):
+        """Block until the politeness scheduler allows a request to `url`"""
+        self.politeness.wait(url)
+
+    def is_checked(self, link):
+        """Return True if `link` has already been checked in this job, or is waiting to be retried"""
+        return link in self.links_checked or link in self.retries
+
+    def load_links_checked(self):
+        """Load the links already checked in this job from the database, e.g. when
+        resuming an interrupted job; otherwise `links_checked` is kept in memory"""
+        self.flush()
+        link_checks = LinkCheck.query.\
+            filter(LinkCheck.job == self.job).\
+            with_entities(LinkCheck.url)
+        self.links_checked.update(link_check.url for link_check in link_checks)
+
+    def request_link(self, link):
+        """Request the resource specified by `link` and return the fields of its
+        `LinkCheck` record. Safe to call from worker threads: no database access"""
+        try:
+            self.wait_turn(link)
+        except BudgetExceeded as exception:
+            return exception_result(exception)
+        with self.host_semaphore(link):
+            # the circuit may have opened while waiting
+            result = self.hosts.circuit_open_result(link)
+            if result is not None:
+                return result
+            start = time.time()
             try:
-                response = requests.get(link_standardized, timeout=GET_TIMEOUT, stream=True, headers=headers)
-                note = None
-                linkcheck_record = LinkCheck(
-                    **link_record_base,
-                    response=response.status_code,
-                )
+                response = self.request_status(link)
+                self.hosts.record_latency(link, time.time() - start)
+                result = dict(response=response.status_code)
+                if response.status_code in self.retry_policy.statuses:
+                    result['retry_after'] = parse_retry_after(response.headers.get('Retry-After'))
                 response.close()
             except Exception as exception:
-                linkcheck_record = LinkCheck(
-                    **link_record_base,
-                    note=str(exception),
-                    exception=type(exception).__name__,
-                )
+                self.hosts.record_failure(link, exception, time.time() - start)
+                result = exception_result(exception)
+        # transient failures are not shared with other jobs
+        if self.is_cacheable(link) and not self.retry_policy.is_retryable(result):
+            result_cache.put(link, result)
+        return result
+
+    def request_status(self, link):
+        """Request `link` for its status, with a HEAD request if enabled and its host
+        supports them, else with a streamed GET, and return the response.
+        A host rejecting HEAD with a 405 or 501 is sent GET requests for the rest of the job"""
+        hostname = parse_url(link).hostname or ''
+        timeout = self.hosts.timeout(link)
+        if self.head_first and self.head_supported.get(hostname, not is_head_unsupported_host(hostname)):
+            response = self.session.head(link, timeout=timeout, allow_redirects=True)
+            if response.status_code not in (405, 501):
+                self.head_supported[hostname] = True
+                return response
+            response.close()
+            self.head_supported[hostname] = False
+        return self.session.get(link, timeout=timeout, stream=True)
+
+    def is_cacheable(self, link):
+        """Return True if the result for `link` can be shared with other jobs"""
+        return not link.startswith(self.url)
+
+    def known_result(self, link):
+        """Return the fields of the `LinkCheck` record for `link` without requesting
+        it, if it has already been followed, its result is cached or its host's
+        circuit is open, else None"""
+        if link in self.page_results:
+            return self.page_results[link]
+        if self.use_cache and self.is_cacheable(link):
+            result = result_cache.get(link)
+            if result is not None:
+                result['cached'] = True
+                return result
+        return self.hosts.circuit_open_result(link)
+
+    def link_result(self, link):
+        """Return the fields of the `LinkCheck` record for `link`, requesting it
+        unless its result is already known"""
+        result = self.known_result(link)
+        if result is None:
+            result = self.request_link(link)
+        return result
+
+    def load_previous_pages(self):
+        """Load the pages followed in the previous job, with their validators"""
+        pages = Page.query.filter(Page.job_id == self.previous_job.id)
+        self.previous_pages = {page.url: page for page in pages}
+
+    def conditional_headers(self, url):
+        """Return the headers requesting page `url` only if it changed since the previous job"""
+        page = self.previous_pages.get(url)
+        if page is None or page.response != 200:
+            return {}
+        headers = {}
+        if page.etag:
+            headers['If-None-Match'] = page.etag
+        if page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+        return headers
+
+    def fetch_page(self, url):
+        """Request page `url` once, conditionally if it was followed in the
+        previous job, and return the outcome as a `PageFetch`"""
+        if is_flat_file(url):
+            return PageFetch(self.request_link(url), None, None, None, False)
+        try:
+            self.wait_turn(url)
+        except BudgetExceeded as exception:
+            return PageFetch(exception_result(exception), None, None, None, False)
+        with self.host_semaphore(url):
+            result = self.hosts.circuit_open_result(url)
+            if result is not None:
+                return PageFetch(result, None, None, None, False)
+            start = time.time()
+            try:
+                # pages get the full timeout, not the host's adaptive one, since a
+                # page that times out is only re-checked, not parsed for links
+                response = self.session.get(
+                    url, timeout=GET_TIMEOUT, headers=self.conditional_headers(url), stream=True)
+                self.hosts.record_latency(url, time.time() - start)
+            except requests.exceptions.SSLError as exception:
+                # links are still collected without verifying certificates
+                try:
+                    response = self.session.get(url, timeout=GET_TIMEOUT, verify=False, stream=True)
+                    html = read_html(response)
+                except requests.exceptions.RequestException:
+                    html = None
+                return PageFetch(exception_result(exception), html, None, None, False)
+            except Exception as exception:
+                print('Error while getting links in {}'.format(url))
+                print(exception)
+                self.hosts.record_failure(url, exception, time.time() - start)
+                return PageFetch(exception_result(exception), None, None, None, False)
 
-        db.session.add(linkcheck_record)
-        db.session.commit()
+            if response.status_code == 304 and url in self.previous_pages:
+                response.close()
+                page = self.previous_pages[url]
+                return PageFetch(
+                    dict(response=page.response, note='Not modified since job {}'.format(page.job_id)),
+                    None, page.etag, page.last_modified, True)
+
+            try:
+                html = read_html(response)
+            except requests.exceptions.RequestException as exception:
+                print('Error while getting links in {}'.format(url))
+                print(exception)
+                html = None
+        return PageFetch(
+            dict(response=response.status_code),
+            html,
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            False)
+
+    def previous_links(self, url):
+        """Return the internal and external links found in page `url` in the previous job"""
+        links = Link.query.\
+            filter(Link.job_id == self.previous_job.id).\
+            filter(Link.source_url == url).\
+            order_by(Link.id).\
+            with_entities(Link.url, Link.internal)
+        internal_links = []
+        external_links = []
+        for link in links:
+            if link.internal:
+                internal_links.append(link.url)
+            else:
+                external_links.append(link.url)
+        return internal_links, external_links
+
+    def record_page(self, url, page):
+        """Persist the `Page` record for followed page `url` given its `PageFetch`"""
+        self.page_results[url] = page.result
+        self.writer.add(Page(
+            url=url,
+            response=page.result.get('response'),
+            etag=page.etag,
+            last_modified=page.last_modified,
+            job_id=self.job.id))
+
+    def record_link_check(self, link, result):
+        """Persist the `LinkCheck` record for `link` given its request `result`"""
+        result.pop('retry_after', None)
+        linkcheck_record = LinkCheck(
+            url_raw=link,
+            url=link,
+            job_id=self.job.id,
+            attempts=self.attempts.pop(link, 0) + 1,
+            **result
+        )
+        self.writer.add(linkcheck_record)
+        self.links_checked.add(link)
+        # a followed page's result is only needed until its own check is recorded
+        self.page_results.pop(link, None)
         return linkcheck_record
 
+    def check_link(self, link):
+        """Request the resources specified by `link` and persist the results"""
+        if self.is_checked(link):
+            return
+        return self.record_or_retry(link, self.link_result(link))
+
+    def retry_delay(self, link, result):
+        """Return the seconds to wait before requesting `link` again given its
+        request `result`, counting the failed attempt, or None to record `result`"""
+        attempts = self.attempts.get(link, 0) + 1
+        delay = self.retry_policy.delay(result, attempts, result.pop('retry_after', None))
+        if delay is not None:
+            print('Retrying {} in {:.1f}s after attempt {}'.format(link, delay, attempts))
+            self.attempts[link] = attempts
+            # a followed page is requested again for its status only
+            self.page_results.pop(link, None)
+        return delay
+
+    def record_or_retry(self, link, result):
+        """Persist the `LinkCheck` record for `link` given its request `result`,
+        unless it is a transient failure to retry, in which case queue the retry"""
+        delay = self.retry_delay(link, result)
+        if delay is not None:
+            self.retries.push(link, delay)
+            return None
+        return self.record_link_check(link, result)
+
+    def check_retries(self, wait=False):
+        """Check the links that are due to be retried. With `wait`, keep going until
+        none are left, sleeping until each is due and checkpointing when due"""
+        while self.retries:
+            links = self.retries.pop_due()
+            if links:
+                self.check_links(links)
+            elif wait:
+                time.sleep(max(0, self.retries.next_due() - time.time()))
+            else:
+                return
+            if wait:
+                self.checkpoint_if_due()
 
     def check_links(self, links):
-        """Check each link in array `links`"""
+        """Check each link in array `links`. Requests are issued concurrently,
+        but records are persisted in the order of `links`, as in a serial check"""
+        if self.workers <= 1:
+            for link in links:
+                self.check_link(link)
+            return
+
+        # dedupe up front, since records are only persisted after the requests
+        links_pending = []
+        links_seen = set()
         for link in links:
-            self.check_link(link)
+            if link in links_seen:
+                continue
+            links_seen.add(link)
+            if not self.is_checked(link):
+                links_pending.append(link)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = executor.map(self.link_result, links_pending)
+            for link, result in zip(links_pending, results):
+                self.record_or_retry(link, result)
+
+    def persist_links(self, internal_links, external_links, source_url):
+        """Persist a `Link` record for each link in `internal_links` and
+        `external_links` found in `source_url`"""
+        self.writer.add_all(
+            Link(url=link, source_url=source_url, internal=True, job_id=self.job.id)
+            for link in internal_links)
+        self.writer.add_all(
+            Link(url=link, source_url=source_url, internal=False, job_id=self.job.id)
+            for link in external_links)
+
+    def flush(self):
+        """Persist all buffered `Link`, `LinkCheck` and `Page` records"""
+        self.writer.flush()
+
+    def fetch_links(self, url):
+        """Fetch and record page `url`, persist the links found in it and return
+        them as a tuple: (`internal_links`, `external_links`)"""
+        page = self.fetch_page(url)
+        self.record_page(url, page)
+        if page.not_modified:
+            internal_links, external_links = self.previous_links(url)
+        else:
+            internal_links, external_links = parse_page(page.html, url, self.url)
 
-    def check_all_links(self, url):
-        """Find all links within `url` and check each one"""
+        # persist source links
+        self.persist_links(internal_links, external_links, url)
+        return internal_links, external_links
+
+    def check_all_links(self, url, depth=0):
+        """Find all links within `url`, found `depth` links away from the root URL,
+        queue its internal links for following and check each link. Links that are
+        queued or being followed are left to be checked when they are followed, so
+        that each page is only requested once"""
         url_standardized = standardize_url(url)
         print('Checking all links found in {}'.format(url_standardized))
-        links = get_all_links(url_standardized)
-        _internal_links, external_links = group_links_internal_external(links, url_standardized)
-        internal_links = []
-        for internal_link in _internal_links:
-            if internal_link.startswith(self.url):
-                internal_links.append(internal_link)
-            else:
-                # link is above root so we don't want to scan it's children
-                external_links.append(internal_link)
+        internal_links, external_links = self.fetch_links(url_standardized)
 
-        # persist source links
-        standardized_links = internal_links + external_links
-        for link in standardized_links:
-            link_record = Link(url=link, source_url=url_standardized, job=self.job)
-            db.session.add(link_record)
-        db.session.commit()
-
-        # check links and return internal links for following
-        self.check_links(internal_links)
-        self.check_links(external_links)
+        # queue internal links for following and check links
+        self.queue_links(internal_links, depth + 1)
+        self.check_links([link for link in internal_links if not self.is_deferred(link)])
+        self.check_links([link for link in external_links if not self.is_deferred(link)])
         return internal_links
 
-    def check_all_links_and_follow(self, url=None):
-        """Recursively check all links in all sub-pages of `url`"""
-        if url is None:
-            url = self.url
+    def is_deferred(self, link):
+        """Return True if `link` will be checked when it is followed"""
+        if link in self.frontier:
+            return True
+        return link in self.links_checked_and_followed and link not in self.page_results
+
+    def queue_links(self, links, depth):
+        """Queue internal `links` found `depth` links away from the root URL for following"""
+        for link in links:
+            url_standardized = standardize_url(link)
+            if url_standardized not in self.links_checked_and_followed:
+                self.frontier.push(url_standardized, depth)
 
-        # break if page limit exceeded
+    def is_stopped(self):
+        """Return True if the crawl has been asked to stop (see `stopped`)"""
+        return self.stopped is not None and self.stopped.is_set()
+
+    def raise_if_stopped(self):
+        """Raise `CrawlStopped` if the crawl has been asked to stop"""
+        if self.is_stopped():
+            raise CrawlStopped('Crawl of {} stopped'.format(self.url))
+
+    def page_limit_exceeded(self):
+        """Return True if no more pages should be followed"""
         if len(self.links_checked_and_followed) > PAGE_LIMIT:
-            print('Page limit {:,} exceeded for {}'.format(PAGE_LIMIT, url))
-            return
+            print('Page limit {:,} exceeded for {}'.format(PAGE_LIMIT, self.url))
+            return True
+        return False
 
-        url_standardized = standardize_url(url)
-        if url_standardized in self.links_checked_and_followed:
-            return
-        self.links_checked_and_followed.add(url_standardized)
-        internal_links = self.check_all_links(url)
-        for internal_link in internal_links:
-            self.check_all_links_and_follow(internal_link)
+    def check_all_links_and_follow(self, url=None):
+        """Check all links in all sub-pages of `url`, following pages in frontier order"""
+        if url is None:
+            url = self.url
+        self.queue_links([url], 0)
+        while self.frontier and not self.page_limit_exceeded():
+            self.raise_if_stopped()
+            url, depth = self.frontier.pop()
+            self.links_checked_and_followed.add(url)
+            self.check_all_links(url, depth)
+            if depth > 0:
+                # pages other than the root were found as links, so record their check
+                self.check_link(url)
+            self.check_retries()
+            self.checkpoint_if_due()
+        # the links left at the page limit stay in the frontier, and so in the
+        # checkpoint, until a batch of them is checked
+        while self.frontier:
+            self.raise_if_stopped()
+            self.check_links(self.unfollowed_links(UNFOLLOWED_BATCH_SIZE))
+            self.check_retries()
+            self.checkpoint_if_due()
+        self.check_retries(wait=True)
+        self.flush()
+
+    def unfollowed_links(self, limit=None):
+        """Remove and return the internal links left in the frontier, up to `limit`"""
+        count = len(self.frontier) if limit is None else min(limit, len(self.frontier))
+        return [self.frontier.pop()[0] for _ in range(count)]
 
     def get_results(self, matcher):
         """Return a formatted JSON document describing any errors
         matching function `matcher`"""
+        self.flush()
         return LinkCheck.query.\
             filter(LinkCheck.job == self.job).\
             filter(matcher(LinkCheck.response))
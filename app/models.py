@@ -10,12 +10,27 @@ class Link(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.Text, index=True)
     source_url = db.Column(db.Text, index=True)
+    internal = db.Column(db.Boolean)
     job_id = db.Column(db.Integer, db.ForeignKey('scan_job.id'), nullable=False)
 
     def __repr__(self):
         return '<{} --> {}>'.format(self.source_url, self.url)
 
 
+class Page(db.Model):
+    """Data model representing a page followed in a scan job, with the validators
+    for conditionally requesting it in the next job"""
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.Text, index=True)
+    response = db.Column(db.Integer)
+    etag = db.Column(db.Text)
+    last_modified = db.Column(db.Text)
+    job_id = db.Column(db.Integer, db.ForeignKey('scan_job.id'), nullable=False, index=True)
+
+    def __repr__(self):
+        return '<Page {}: {}>'.format(self.url, self.response)
+
+
 class LinkCheck(db.Model):
     """Data model representing a request and response for single link"""
     id = db.Column(db.Integer, primary_key=True)
@@ -25,6 +40,8 @@ class LinkCheck(db.Model):
     note = db.Column(db.Text)
     text = db.Column(db.Text)
     exception = db.Column(db.String(20), index=True)
+    cached = db.Column(db.Boolean)
+    attempts = db.Column(db.Integer)
     job_id = db.Column(db.Integer, db.ForeignKey('scan_job.id'), nullable=False)
 
     def __repr__(self):
@@ -53,7 +70,7 @@ class LinkCheck(db.Model):
             return 2
         if self.response == 999 and 'linkedin.com' in self.url:
             return 0
-        if self.exception == 'InvalidSchema':
+        if self.exception in ('InvalidSchema', 'BudgetExceeded'):
             return 0
         if self.url.startswith('javascript'):
             return 0
@@ -72,7 +89,7 @@ class LinkCheck(db.Model):
                 (cls.response == '403', 2),
                 (cls.exception == 'SSLError', 2),
                 (and_(cls.response == '999', cls.url.contains('linkedin.com')), 0),
-                (cls.exception == 'InvalidSchema', 0),
+                (cls.exception.in_(('InvalidSchema', 'BudgetExceeded')), 0),
                 (cls.url.like('javascript%'), 2),
                 (cls.exception != None, 1),
                 (cls.response != '200', 1),
@@ -110,9 +127,16 @@ class ScanJob(db.Model):
     start_time = db.Column(db.DateTime, nullable=False)
     link_checks = db.relationship('LinkCheck', backref='job', lazy='dynamic')
     links = db.relationship('Link', backref='job', lazy='dynamic')
+    pages = db.relationship('Page', backref='job', lazy='dynamic')
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     owner_id = db.Column(db.Integer, db.ForeignKey('owners.id'), nullable=False)
     status = db.Column(db.Text)
+    checkpoint = db.Column(db.Text)
+    checkpoint_time = db.Column(db.DateTime)
+    resumes = db.Column(db.Integer)
+    pages_followed = db.Column(db.Integer)
+    requests_reserved = db.Column(db.Integer)
+    crawl_urls = db.relationship('CrawlUrl', backref='job', lazy='dynamic')
 
     def __repr__(self):
         return '<URL {} {}: {}>'.format(self.root_url, self.start_time, self.status)
@@ -191,6 +215,8 @@ class Owner(db.Model):
     scheduled_jobs = db.relationship('ScheduledJob', backref='owner', lazy='dynamic')
     permissioned_urls = db.relationship('PermissionedURL', backref='owner', lazy='dynamic')
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    scan_weight = db.Column(db.Integer)
+    scan_quota = db.Column(db.Integer)
     __table_args__ = (UniqueConstraint(
         'email',
         'user_id',
@@ -223,3 +249,79 @@ class Exception(db.Model):
             exception=self.exception,
             exception_description=self.exception_description,
         )
+
+
+class CrawlUrl(db.Model):
+    """Data model representing a URL found in a scan job crawled in shards.
+    Each URL is stored once per job, so that the table is the visited set
+    shared by the job's shards; the URL's own shard follows or checks it"""
+    __tablename__ = 'crawl_url'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('scan_job.id'), nullable=False)
+    url = db.Column(db.Text, nullable=False)
+    shard = db.Column(db.Integer, nullable=False)
+    depth = db.Column(db.Integer, nullable=False)
+    follow = db.Column(db.Boolean, nullable=False)
+    status = db.Column(db.Text, nullable=False)
+    __table_args__ = (
+        UniqueConstraint('job_id', 'url', name='unique_job_crawl_urls'),
+        db.Index('ix_crawl_url_job_shard_status', 'job_id', 'shard', 'status'),
+    )
+
+    def __repr__(self):
+        return '<Crawl URL {} [shard {}]: {}>'.format(self.url, self.shard, self.status)
+
+
+class Lease(db.Model):
+    """Data model representing a named lease held by one process at a time, such
+    as the lease to run the scheduler, until `expires` unless renewed"""
+    __tablename__ = 'lease'
+    name = db.Column(db.Text, primary_key=True)
+    owner = db.Column(db.Text, nullable=False)
+    expires = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<Lease {} held by {} until {}>'.format(self.name, self.owner, self.expires)
+
+
+class WorkItem(db.Model):
+    """Data model representing a unit of work in a queue shared by worker processes,
+    such as a whole scan. A claimed item is leased to one worker until
+    `lease_expires`, which the worker extends with heartbeats while it works.
+    An item queued again to run later isn't claimed before `not_before`"""
+    __tablename__ = 'work_item'
+    id = db.Column(db.Integer, primary_key=True)
+    queue = db.Column(db.Text, index=True, nullable=False)
+    kind = db.Column(db.Text, nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.Text, index=True, nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    lease_owner = db.Column(db.Text)
+    lease_expires = db.Column(db.DateTime, index=True)
+    not_before = db.Column(db.DateTime)
+    scan_job_id = db.Column(db.Integer, db.ForeignKey('scan_job.id'))
+    owner_id = db.Column(db.Integer, db.ForeignKey('owners.id'), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    error = db.Column(db.Text)
+    created_time = db.Column(db.DateTime, nullable=False)
+    finished_time = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Work item {} {} [{}]: {}>'.format(self.id, self.kind, self.queue, self.status)
+
+    def to_json(self):
+        return dict(
+            id=self.id,
+            queue=self.queue,
+            kind=self.kind,
+            status=self.status,
+            priority=self.priority,
+            attempts=self.attempts,
+            scan_job_id=self.scan_job_id,
+            owner_id=self.owner_id,
+            user_id=self.user_id,
+            created_time=self.created_time,
+            not_before=self.not_before,
+            finished_time=self.finished_time,
+        )
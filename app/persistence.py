@@ -0,0 +1,41 @@
+"""Buffered, bulk persistence of scan records"""
+import time
+from . import db
+from .globals import FLUSH_ROWS, FLUSH_SECONDS
+
+
+class BufferedWriter(object):
+    """Buffer new model records and insert them in bulk, in one transaction per
+    flush rather than one per record. The buffer is flushed once it holds
+    `max_rows` records or `max_seconds` after the last flush; call `flush` to
+    write out whatever remains, e.g. when the job completes.
+    Records are inserted with `bulk_save_objects`, which batches them into
+    executemany statements per table but doesn't process relationships, so
+    foreign keys must be set by ID"""
+    def __init__(self, max_rows=FLUSH_ROWS, max_seconds=FLUSH_SECONDS):
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.records = []
+        self.last_flush = time.time()
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        """Buffer `record`, flushing the buffer if it's full or due"""
+        self.records.append(record)
+        if len(self.records) >= self.max_rows or time.time() - self.last_flush >= self.max_seconds:
+            self.flush()
+
+    def add_all(self, records):
+        """Buffer each record in `records`"""
+        for record in records:
+            self.add(record)
+
+    def flush(self):
+        """Insert all buffered records"""
+        if self.records:
+            db.session.bulk_save_objects(self.records)
+            db.session.commit()
+        self.records = []
+        self.last_flush = time.time()
@@ -0,0 +1,103 @@
+"""Per-host politeness: request rates, robots.txt crawl delays and request budgets"""
+import threading
+import time
+from urllib import robotparser
+from .urls import parse_url
+from .globals import GET_TIMEOUT, HOST_RATE, HOST_BURST, REQUEST_BUDGET
+
+
+class BudgetExceeded(Exception):
+    """The scan has made as many requests as its budget allows"""
+
+
+class TokenBucket(object):
+    """Token bucket allowing `rate` requests per second in bursts of up to `capacity`.
+    Tokens are reserved ahead of time: `reserve` always takes a token and returns
+    how long to wait before using it, so concurrent callers are spaced out"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returning the seconds to wait before using it"""
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+
+class PolitenessScheduler(object):
+    """Spaces out a scan's requests to each host with a token bucket per host.
+    The scanned site's own host is limited to its robots.txt `Crawl-delay`, if it
+    sets one; other hosts, which only receive link checks, get the default
+    `rate` and `burst`. At most `budget` requests are allowed per scan (None
+    for no budget). A scan crawled by several processes gives each a scheduler
+    with one of `shares` equal shares of the rate limits"""
+    def __init__(self, site_url, session, rate=HOST_RATE, burst=HOST_BURST, budget=REQUEST_BUDGET, shares=1):
+        self.site_hostname = parse_url(site_url).hostname
+        self.site_url = site_url
+        self.session = session
+        self.shares = shares
+        self.rate = rate / shares
+        self.burst = burst
+        self.budget = budget
+        self.requests_reserved = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def crawl_delay(self):
+        """Return the `Crawl-delay` set by the site's robots.txt, or None"""
+        u = parse_url(self.site_url)
+        robots_url = '{}://{}/robots.txt'.format(u.scheme, u.netloc)
+        try:
+            response = self.session.get(robots_url, timeout=GET_TIMEOUT)
+        except Exception as exception:
+            print('Error while getting {}'.format(robots_url))
+            print(exception)
+            return None
+        if response.status_code != 200:
+            return None
+        robots = robotparser.RobotFileParser(robots_url)
+        robots.parse(response.text.splitlines())
+        delay = robots.crawl_delay('*')
+        return float(delay) if delay else None
+
+    def bucket(self, hostname):
+        """Return the token bucket for `hostname`"""
+        with self._lock:
+            if hostname not in self._buckets:
+                delay = self.crawl_delay() if hostname == self.site_hostname else None
+                if delay:
+                    self._buckets[hostname] = TokenBucket(1 / (delay * self.shares), 1)
+                else:
+                    self._buckets[hostname] = TokenBucket(self.rate, self.burst)
+            return self._buckets[hostname]
+
+    def reserve_budget(self):
+        """Count a request against the scan's budget. Returns False if the budget is spent"""
+        with self._lock:
+            if self.budget is not None and self.requests_reserved >= self.budget:
+                return False
+            self.requests_reserved += 1
+            return True
+
+    def reserve(self, url):
+        """Reserve a request to `url`, returning the seconds to wait before making it.
+        Raises `BudgetExceeded` once the scan's budget is spent"""
+        if not self.reserve_budget():
+            raise BudgetExceeded(
+                'Not checked: request budget of {:,} exceeded'.format(self.budget))
+        return self.bucket(parse_url(url).hostname or '').reserve()
+
+    def wait(self, url):
+        """Block until a request to `url` may be made"""
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
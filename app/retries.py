@@ -0,0 +1,92 @@
+"""Retrying transient failures with exponential backoff, jitter and Retry-After"""
+import datetime
+import heapq
+import itertools
+import random
+import time
+from email.utils import parsedate_to_datetime
+from .globals import MAX_ATTEMPTS, RETRY_BACKOFF, RETRY_MAX_DELAY, RETRY_STATUSES, RETRY_EXCEPTIONS
+
+
+def parse_retry_after(value):
+    """Return the seconds to wait given a `Retry-After` header, in seconds or as an
+    HTTP date, or None if it is missing or invalid"""
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max(0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class RetryPolicy(object):
+    """Retries responses with a status in `statuses` and failures with an exception
+    in `exceptions`, up to `max_attempts` attempts in all. Retries are delayed by
+    exponential backoff with full jitter, or by the `Retry-After` the server
+    asked for if longer; a server asking for more than `max_delay` is not retried"""
+    def __init__(self, max_attempts=MAX_ATTEMPTS, backoff=RETRY_BACKOFF, max_delay=RETRY_MAX_DELAY,
+                 statuses=RETRY_STATUSES, exceptions=RETRY_EXCEPTIONS):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.statuses = statuses
+        self.exceptions = exceptions
+
+    def is_retryable(self, result):
+        """Return True if the `LinkCheck` fields `result` describe a transient failure"""
+        return result.get('response') in self.statuses or result.get('exception') in self.exceptions
+
+    def delay(self, result, attempts, retry_after=None):
+        """Return the seconds to wait before another attempt, given `result` of
+        attempt number `attempts`, or None if it should not be retried"""
+        if attempts >= self.max_attempts or not self.is_retryable(result):
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.backoff * 2 ** (attempts - 1)))
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryQueue(object):
+    """Links waiting to be requested again, in the order they are due"""
+    def __init__(self):
+        self._heap = []
+        self._links = set()
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, link):
+        return link in self._links
+
+    def __iter__(self):
+        return iter(list(self._links))
+
+    def push(self, link, delay):
+        """Queue `link` to be requested again in `delay` seconds"""
+        heapq.heappush(self._heap, (time.time() + delay, next(self._order), link))
+        self._links.add(link)
+
+    def next_due(self):
+        """Return the time the next link is due, or None if there are none"""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self):
+        """Remove and return the links that are due"""
+        now = time.time()
+        links = []
+        while self._heap and self._heap[0][0] <= now:
+            link = heapq.heappop(self._heap)[2]
+            self._links.discard(link)
+            links.append(link)
+        return links
@@ -0,0 +1,19 @@
+"""Pooled HTTP sessions for scanner traffic"""
+import requests
+from requests.adapters import HTTPAdapter
+from .globals import POOL_CONNECTIONS, POOL_MAXSIZE
+
+
+def scan_session(headers=None, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """Return a `requests.Session` for the requests of a single scan.
+    Connections are kept alive and pooled per host, so repeated requests to the
+    same origin reuse an open TCP (and TLS) connection rather than handshaking
+    again. `pool_connections` is the number of hosts whose pools are kept, and
+    `pool_maxsize` the number of open connections kept per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
@@ -0,0 +1,248 @@
+"""Sharded crawling: a single scan job crawled by several worker processes"""
+import datetime
+import zlib
+from sqlalchemy import and_, bindparam
+from sqlalchemy.dialects import postgresql
+from .globals import PAGE_LIMIT, REQUEST_BUDGET, SHARD_BATCH_SIZE
+from .link_check import LinkChecker, ensure_protocol, standardize_url, standardize_descheme_url
+from .politeness import PolitenessScheduler
+from . import db
+from .models import CrawlUrl, ScanJob
+
+
+def url_shard(url, shards):
+    """Return the shard of `shards` that `url` belongs to. The hash is stable
+    across processes, unlike Python's `hash` of a string"""
+    return zlib.crc32(url.encode('utf-8')) % shards
+
+
+def insert_ignoring_duplicates():
+    """Return an insert into `CrawlUrl` that skips URLs already in their job"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(CrawlUrl.__table__).on_conflict_do_nothing(index_elements=['job_id', 'url'])
+    if dialect == 'mysql':
+        return CrawlUrl.__table__.insert().prefix_with('IGNORE')
+    return CrawlUrl.__table__.insert().prefix_with('OR IGNORE')
+
+
+def add_crawl_urls(job_id, urls, depth, follow, shards, commit=True):
+    """Add `urls`, found `depth` links away from the root URL, to job `job_id`
+    to be followed (`follow`) or checked by their shards. URLs already in the
+    job are skipped, except that links to check are upgraded to pages to
+    follow if their shards haven't claimed them yet. With `commit` False, the
+    URLs are left for the caller to commit"""
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return
+    db.session.execute(insert_ignoring_duplicates(), [
+        dict(job_id=job_id, url=url, shard=url_shard(url, shards), depth=depth, follow=follow, status='queued')
+        for url in urls])
+    if follow:
+        table = CrawlUrl.__table__
+        db.session.execute(
+            table.update().
+            where(and_(
+                table.c.job_id == bindparam('job'),
+                table.c.url == bindparam('crawl_url'),
+                table.c.follow == False,
+                table.c.status == 'queued')).
+            values(follow=True),
+            [dict(job=job_id, crawl_url=url) for url in urls])
+    if commit:
+        db.session.commit()
+
+
+def start_sharded_job(url, user, owner, shards, commit=True):
+    """Create the scan job for crawling `url` in `shards` shards, with its root URL
+    queued. With `commit` False, the job is left for the caller to commit, along
+    with the work items of its shards"""
+    url = ensure_protocol(standardize_url(url))
+    job = ScanJob(
+        root_url=standardize_descheme_url(url),
+        start_time=datetime.datetime.utcnow(),
+        user=user,
+        status='in progress',
+        owner=owner,
+        pages_followed=0,
+        requests_reserved=0)
+    db.session.add(job)
+    db.session.flush()
+    add_crawl_urls(job.id, [standardize_url(url)], 0, True, shards, commit)
+    return job
+
+
+class JobPolitenessScheduler(PolitenessScheduler):
+    """Politeness scheduler for one of `shares` shards of scan job `job_id`.
+    The job's request budget is counted on the job, with the same atomic
+    conditional update as its pages followed, so that it holds across the
+    job's shards and each of their runs. Requests are reserved from worker
+    threads, so they are counted through `engine` rather than a session"""
+    def __init__(self, site_url, session, job_id, engine, budget=REQUEST_BUDGET, shares=1):
+        super().__init__(site_url, session, budget=budget, shares=shares)
+        self.job_id = job_id
+        self.engine = engine
+
+    def reserve_budget(self):
+        """Count a request against the job's budget. Returns False if the budget is spent"""
+        if self.budget is None:
+            return True
+        table = ScanJob.__table__
+        with self.engine.begin() as connection:
+            reserved = connection.execute(
+                table.update().
+                where(and_(table.c.id == self.job_id, table.c.requests_reserved < self.budget)).
+                values(requests_reserved=table.c.requests_reserved + 1)).rowcount
+        if reserved:
+            with self._lock:
+                self.requests_reserved += 1
+        return bool(reserved)
+
+
+class ShardedLinkChecker(LinkChecker):
+    """Link checker crawling shard `shard` of `shards` of scan `job`, alongside
+    checkers for the other shards, usually on other worker processes.
+    Every URL found belongs to the shard given by its hash. The job's URLs are
+    kept in the `CrawlUrl` table, the visited set shared by all shards: each
+    URL is added once, by whichever shard finds it first, and is followed or
+    checked by its own shard, which claims its URLs `batch_size` at a time.
+    Pages followed and requests are counted on the job, so that the page limit
+    and the request budget hold across shards: as in `LinkChecker`, the root
+    page and `PAGE_LIMIT` more are followed, and pages left once the limit is
+    reached are checked rather than followed.
+    Other shards may find more URLs for a shard after it runs out, so the job
+    is only complete once none of its URLs are left (see `finish_job`)"""
+    def __init__(self, url, user, owner, shard, shards, job, batch_size=SHARD_BATCH_SIZE,
+                 request_budget=REQUEST_BUDGET, **kwargs):
+        self.shard = shard
+        self.shards = shards
+        self.batch_size = batch_size
+        super().__init__(url, user, owner, job=job, request_budget=request_budget, **kwargs)
+        # the shards share the politeness limits of a single crawl
+        self.politeness = JobPolitenessScheduler(
+            self.url, self.session, job.id, db.engine, budget=request_budget, shares=shards)
+
+    def restore_checkpoint(self):
+        """Queue again the URLs claimed by an earlier attempt at this shard, which
+        stopped before finishing them, and load the links already checked"""
+        released = CrawlUrl.query.\
+            filter(CrawlUrl.job_id == self.job.id).\
+            filter(CrawlUrl.shard == self.shard).\
+            filter(CrawlUrl.status == 'claimed').\
+            update(dict(status='queued'), synchronize_session=False)
+        db.session.commit()
+        if released:
+            print('Resuming shard {} of job {} with {} URLs released'.format(self.shard, self.job.id, released))
+            self.load_links_checked()
+
+    def checkpoint_if_due(self, pages_in_progress=()):
+        """A shard's progress is kept in the `CrawlUrl` table rather than checkpointed"""
+
+    def add_urls(self, urls, depth, follow):
+        """Add `urls` to the job for their shards to follow or check"""
+        add_crawl_urls(self.job.id, urls, depth, follow, self.shards)
+
+    def claim_urls(self):
+        """Claim and return the next batch of this shard's queued URLs, shallowest first"""
+        crawl_urls = CrawlUrl.query.\
+            filter(CrawlUrl.job_id == self.job.id).\
+            filter(CrawlUrl.shard == self.shard).\
+            filter(CrawlUrl.status == 'queued').\
+            order_by(CrawlUrl.depth, CrawlUrl.id).\
+            limit(self.batch_size).\
+            with_entities(CrawlUrl.id, CrawlUrl.url, CrawlUrl.depth, CrawlUrl.follow).\
+            all()
+        if crawl_urls:
+            CrawlUrl.query.\
+                filter(CrawlUrl.id.in_([crawl_url.id for crawl_url in crawl_urls])).\
+                update(dict(status='claimed'), synchronize_session=False)
+            db.session.commit()
+        return crawl_urls
+
+    def finish_urls(self, crawl_urls):
+        """Mark `crawl_urls` done, after persisting their records"""
+        self.flush()
+        if not crawl_urls:
+            return
+        CrawlUrl.query.\
+            filter(CrawlUrl.id.in_([crawl_url.id for crawl_url in crawl_urls])).\
+            update(dict(status='done'), synchronize_session=False)
+        db.session.commit()
+
+    def release_urls(self, crawl_urls):
+        """Queue `crawl_urls` again for the shard, unless they are done"""
+        if not crawl_urls:
+            return
+        CrawlUrl.query.\
+            filter(CrawlUrl.id.in_([crawl_url.id for crawl_url in crawl_urls])).\
+            filter(CrawlUrl.status == 'claimed').\
+            update(dict(status='queued'), synchronize_session=False)
+        db.session.commit()
+
+    def urls_pending(self):
+        """Return the number of the job's URLs that any shard has yet to finish"""
+        return CrawlUrl.query.\
+            filter(CrawlUrl.job_id == self.job.id).\
+            filter(CrawlUrl.status.in_(('queued', 'claimed'))).\
+            count()
+
+    def reserve_page(self):
+        """Count a page to follow against the job's page limit. Returns False if
+        the limit has been exceeded: like `LinkChecker`, the job follows up to
+        `PAGE_LIMIT` pages besides its root page"""
+        reserved = ScanJob.query.\
+            filter(ScanJob.id == self.job.id).\
+            filter(ScanJob.pages_followed <= PAGE_LIMIT).\
+            update({ScanJob.pages_followed: ScanJob.pages_followed + 1}, synchronize_session=False)
+        db.session.commit()
+        if not reserved:
+            print('Page limit {:,} exceeded for {}'.format(PAGE_LIMIT, self.url))
+        return bool(reserved)
+
+    def check_all_links(self, url, depth=0):
+        """Find all links within `url`, found `depth` links away from the root URL,
+        and add them to the job for their shards to follow or check"""
+        url_standardized = standardize_url(url)
+        print('Checking all links found in {} [shard {}]'.format(url_standardized, self.shard))
+        internal_links, external_links = self.fetch_links(url_standardized)
+        self.add_urls(internal_links, depth + 1, True)
+        self.add_urls(external_links, depth + 1, False)
+        return internal_links
+
+    def check_all_links_and_follow(self, url=None):
+        """Follow and check this shard's URLs until it has none left. If the
+        crawl is stopped, it stops between batches, and the URLs waiting to be
+        retried are left for the shard's next worker"""
+        retrying = []
+        while True:
+            if self.is_stopped():
+                self.release_urls(retrying)
+                self.raise_if_stopped()
+            crawl_urls = self.claim_urls()
+            if not crawl_urls:
+                break
+            for crawl_url in crawl_urls:
+                if crawl_url.follow and self.reserve_page():
+                    self.links_checked_and_followed.add(crawl_url.url)
+                    self.check_all_links(crawl_url.url, crawl_url.depth)
+            # this shard can't tell whether other pages link to the pages it
+            # followed, so they are always checked, from their fetch results
+            self.check_links([crawl_url.url for crawl_url in crawl_urls])
+            self.check_retries()
+            # URLs waiting to be retried are finished once they are checked
+            self.finish_urls([crawl_url for crawl_url in crawl_urls if crawl_url.url not in self.retries])
+            retrying.extend(crawl_url for crawl_url in crawl_urls if crawl_url.url in self.retries)
+        self.check_retries(wait=True)
+        self.finish_urls(retrying)
+
+    def finish_job(self):
+        """Mark the job completed if none of its URLs are left. Returns True for the
+        one shard that does so"""
+        if self.urls_pending():
+            return False
+        completed = ScanJob.query.\
+            filter(ScanJob.id == self.job.id).\
+            filter(ScanJob.status == 'in progress').\
+            update(dict(status='completed', checkpoint=None), synchronize_session=False)
+        db.session.commit()
+        return bool(completed)
@@ -0,0 +1,270 @@
+"""Disk-backed crawl frontier and visited sets, for crawls too large for memory"""
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from .frontier import breadth_first
+from .globals import SPILL_DIR, SPILL_HOT_SIZE, BLOOM_CAPACITY
+
+
+class BloomFilter(object):
+    """Approximate set membership: no false negatives, and false positives at
+    about `error_rate` once `capacity` items have been added"""
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class SpillStore(object):
+    """SQLite database in a file under `directory`, holding the spilled frontier
+    and visited sets of one job. Changes are only committed at the job's
+    checkpoints, so the file left by a stopped crawl, given as `path`, is
+    reopened as it was at the last checkpoint. The file is deleted on `close`,
+    unless it is kept for resuming the job"""
+    def __init__(self, directory=SPILL_DIR, path=None):
+        if path is None or not os.path.exists(path):
+            handle, path = tempfile.mkstemp(prefix='scan-', suffix='.sqlite3', dir=directory)
+            os.close(handle)
+        self.path = path
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        # uncommitted changes stay in the write-ahead log, out of the reopened file
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.lock = threading.RLock()
+
+    def commit(self):
+        """Commit the changes since the last commit"""
+        with self.lock:
+            self.db.commit()
+
+    def close(self, remove=True):
+        """Close the database, discarding the changes since the last commit, and
+        delete its file if `remove`"""
+        self.db.close()
+        if remove:
+            os.remove(self.path)
+
+
+class DiskUrlSet(object):
+    """Set of URLs stored in table `name` of `store`. The most recently added
+    `hot_size` URLs are also kept in memory, and a Bloom filter answers most
+    lookups of URLs that aren't in the set without reading the database"""
+    def __init__(self, store, name, hot_size=SPILL_HOT_SIZE):
+        self.store = store
+        self.name = name
+        self.hot_size = hot_size
+        self._hot = OrderedDict()
+        self._bloom = BloomFilter()
+        with store.lock:
+            store.db.execute('CREATE TABLE IF NOT EXISTS {} (url TEXT PRIMARY KEY)'.format(name))
+            self._len = store.db.execute('SELECT count(*) FROM {}'.format(name)).fetchone()[0]
+        # the URLs of a reopened set go into the Bloom filter
+        for url in self:
+            self._bloom.add(url)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, url):
+        if url in self._hot:
+            return True
+        if url not in self._bloom:
+            return False
+        with self.store.lock:
+            return self.store.db.execute(
+                'SELECT 1 FROM {} WHERE url = ?'.format(self.name), (url,)).fetchone() is not None
+
+    def __iter__(self):
+        rowid = 0
+        while True:
+            with self.store.lock:
+                rows = self.store.db.execute(
+                    'SELECT rowid, url FROM {} WHERE rowid > ? ORDER BY rowid LIMIT 1000'.format(self.name),
+                    (rowid,)).fetchall()
+            if not rows:
+                return
+            for rowid, url in rows:
+                yield url
+
+    def __eq__(self, other):
+        return set(self) == set(other)
+
+    def __repr__(self):
+        return '<DiskUrlSet of {} URLs>'.format(len(self))
+
+    def add(self, url):
+        """Add `url` to the set"""
+        if url in self:
+            return
+        with self.store.lock:
+            self.store.db.execute('INSERT INTO {} (url) VALUES (?)'.format(self.name), (url,))
+        self._bloom.add(url)
+        self._len += 1
+        self._hot[url] = None
+        if len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def update(self, urls):
+        """Add each URL in iterable `urls` to the set"""
+        for url in urls:
+            self.add(url)
+
+    def discard(self, url):
+        """Remove `url` from the set if it is there. The Bloom filter can't forget
+        it, so lookups of it read the database"""
+        with self.store.lock:
+            removed = self.store.db.execute('DELETE FROM {} WHERE url = ?'.format(self.name), (url,)).rowcount
+        self._len -= removed
+        self._hot.pop(url, None)
+
+
+class DiskFrontier(object):
+    """Frontier that keeps up to `hot_size` pages in memory and spills the rest to
+    `store`. Pages are popped in exactly the order `Frontier` pops them: the next
+    page is the better of the heads of the in-memory heap and the spilled table,
+    and a spilled page pushed again is moved back into memory to be re-prioritised"""
+    def __init__(self, store, priority=breadth_first, hot_size=SPILL_HOT_SIZE):
+        self.store = store
+        self.priority = priority
+        self.hot_size = hot_size
+        self._heap = []
+        self._queued = {}  # url -> (priority, discovery order, depth, inbound links), in memory
+        self._bloom = BloomFilter()  # urls ever spilled
+        with store.lock:
+            store.db.execute(
+                'CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, priority REAL, discovery_order INTEGER, '
+                'depth INTEGER, inbound_links INTEGER)')
+            store.db.execute('CREATE INDEX IF NOT EXISTS frontier_order ON frontier (priority, discovery_order)')
+            # a reopened frontier carries on from its spilled pages
+            self._spilled, last_order = store.db.execute(
+                'SELECT count(*), max(discovery_order) FROM frontier').fetchone()
+            for url, in store.db.execute('SELECT url FROM frontier'):
+                self._bloom.add(url)
+        self._discovery_order = itertools.count(last_order + 1 if last_order is not None else 0)
+
+    def __len__(self):
+        return len(self._queued) + self._spilled
+
+    def __contains__(self, url):
+        if url in self._queued:
+            return True
+        if not self._spilled or url not in self._bloom:
+            return False
+        with self.store.lock:
+            return self.store.db.execute('SELECT 1 FROM frontier WHERE url = ?', (url,)).fetchone() is not None
+
+    def _unspill(self, url):
+        """Remove `url` from the spilled table and return its entry, or None"""
+        if not self._spilled or url not in self._bloom:
+            return None
+        with self.store.lock:
+            row = self.store.db.execute(
+                'SELECT priority, discovery_order, depth, inbound_links FROM frontier WHERE url = ?',
+                (url,)).fetchone()
+            if row is None:
+                return None
+            self.store.db.execute('DELETE FROM frontier WHERE url = ?', (url,))
+        self._spilled -= 1
+        return row
+
+    def entries(self):
+        """Return the queued pages in discovery order, as tuples: (`url`, `depth`, `inbound_links`)"""
+        with self.store.lock:
+            spilled = self.store.db.execute(
+                'SELECT url, priority, discovery_order, depth, inbound_links FROM frontier').fetchall()
+        queued = [(url,) + entry for url, entry in self._queued.items()] + spilled
+        queued.sort(key=lambda entry: entry[2])
+        return [(url, depth, inbound_links) for url, _, _, depth, inbound_links in queued]
+
+    def hot_entries(self):
+        """Return the pages held in memory, as lists: [`url`, `priority`,
+        `discovery_order`, `depth`, `inbound_links`]"""
+        return [[url] + list(queued) for url, queued in self._queued.items()]
+
+    def restore(self, entries):
+        """Queue again the pages returned by `hot_entries`, e.g. after reopening
+        the spilled pages of a stopped crawl"""
+        last_order = next(self._discovery_order) - 1
+        for url, priority, order, depth, inbound_links in entries:
+            self._queued[url] = (priority, order, depth, inbound_links)
+            heapq.heappush(self._heap, (priority, order, url))
+            last_order = max(last_order, order)
+        self._discovery_order = itertools.count(last_order + 1)
+
+    def push(self, url, depth=0, inbound_links=1):
+        """Queue `url`, found `depth` links away from the root URL, counting
+        `inbound_links` more links to it"""
+        links_found = inbound_links
+        queued = self._queued.get(url)
+        in_heap = queued is not None
+        if queued is None:
+            queued = self._unspill(url)
+        if queued is not None:
+            _priority, order, queued_depth, inbound_links = queued
+            depth = min(depth, queued_depth)
+            inbound_links += links_found
+        else:
+            _priority, order = None, next(self._discovery_order)
+        priority = self.priority(depth, inbound_links)
+        self._queued[url] = (priority, order, depth, inbound_links)
+        if priority != _priority or not in_heap:
+            heapq.heappush(self._heap, (priority, order, url))
+        if len(self._queued) > self.hot_size:
+            self._spill()
+
+    def _spill(self):
+        """Move the half of the in-memory pages that would be popped last to disk"""
+        spilled = heapq.nlargest(len(self._queued) // 2, self._queued.items(), key=lambda item: item[1][:2])
+        with self.store.lock:
+            self.store.db.executemany(
+                'INSERT INTO frontier (url, priority, discovery_order, depth, inbound_links) VALUES (?, ?, ?, ?, ?)',
+                [(url,) + queued for url, queued in spilled])
+        for url, _queued in spilled:
+            del self._queued[url]
+            self._bloom.add(url)
+        self._spilled += len(spilled)
+        self._heap = [(queued[0], queued[1], url) for url, queued in self._queued.items()]
+        heapq.heapify(self._heap)
+
+    def pop(self):
+        """Remove and return the next page to follow as a tuple: (`url`, `depth`)"""
+        while self._heap:
+            priority, order, url = self._heap[0]
+            queued = self._queued.get(url)
+            if queued is not None and queued[:2] == (priority, order):
+                break
+            heapq.heappop(self._heap)
+        spilled = None
+        if self._spilled:
+            with self.store.lock:
+                spilled = self.store.db.execute(
+                    'SELECT priority, discovery_order, depth, url FROM frontier '
+                    'ORDER BY priority, discovery_order LIMIT 1').fetchone()
+        if self._heap and (spilled is None or self._heap[0][:2] <= tuple(spilled[:2])):
+            _priority, _order, url = heapq.heappop(self._heap)
+            return url, self._queued.pop(url)[2]
+        if spilled is not None:
+            with self.store.lock:
+                self.store.db.execute('DELETE FROM frontier WHERE url = ?', (spilled[3],))
+            self._spilled -= 1
+            return spilled[3], spilled[2]
+        raise IndexError('pop from an empty frontier')
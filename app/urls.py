@@ -0,0 +1,156 @@
+"""URL normalization. Each URL string is parsed once, and the results of the
+normalization functions are memoized in bounded LRU caches, since the same
+links recur on every page of a site"""
+from functools import lru_cache
+from requests.compat import urljoin, urlparse
+from .globals import URL_CACHE_SIZE
+
+
+web_extensions = ('html', 'htm', 'aspx', 'php', 'asp', 'cfm', 'xml')
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def parse_url(url, scheme=''):
+    """Return `url` parsed into a `ParseResult`, shared by all callers"""
+    return urlparse(url, scheme)
+
+
+def is_relative_url(url):
+    """Return True if `url` takes its host from the URL it is joined to"""
+    u = parse_url(url, 'http')
+    return u.scheme == 'http' and not u.netloc
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def get_base_url(url):
+    """Strip the scheme and trailing slashes from the URL"""
+    if (url.startswith('http')) and ('//' in url):
+        u = parse_url(url)
+        url_root = u.netloc + u.path
+    else:
+        url_root = url
+    url_stripped = url_root[:-1] if url_root.endswith('/') else url_root
+    return url_stripped
+
+
+def get_hostname(url):
+    """strip the path and query string from the url"""
+    u = parse_url(url)
+    return '{}://{}'.format(u.scheme, u.hostname)
+
+
+def points_to_self(link, url_self):
+    """Return true IFF `link` points to `url_self`"""
+    if link == '/':
+        return True
+    if get_base_url(link) == get_base_url(url_self):
+        return True
+    return False
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def remove_web_extensions(link):
+    """ Remove web extensions (e.g., html, asp) from link URL
+    """
+    link_no_web_extensions = link
+    for extension in web_extensions:
+        link_no_web_extensions = link_no_web_extensions.replace('.' + extension, '')
+    return link_no_web_extensions
+
+
+def is_internal_link(link, reference_url):
+    """Return true IFF `link` is a sub-component of `reference_url`"""
+    return is_internal_to_base(link, get_base_url(reference_url))
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def is_internal_to_base(link, reference_base):
+    """Return true IFF `link` is a sub-component of the URL with base `reference_base`"""
+    if link.startswith('//'):
+        return False
+    if link.startswith('/') or link.startswith('#') or link.startswith('.'):
+        return True
+    if get_base_url(link).startswith(reference_base):
+        return True
+    link_no_web_extensions = remove_web_extensions(link)
+    if '.' not in link_no_web_extensions:
+        return True
+    return False
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def ensure_protocol(url, protocol='http'):
+    if parse_url(url).scheme:
+        return url
+    if url.startswith('javascript:') or url.startswith('mailto:'):
+        return url
+    if url.startswith('//'):
+        return protocol + ':' + url
+    return protocol + '://' + url
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def prepend_if_relative(url, url_base, keep_anchors=False):
+    """Standardize `url` by prepending it with the hostname if relative"""
+    return join_url(url, standardize_url(url_base, True), keep_anchors)
+
+
+def join_url(url, url_base, keep_anchors=False):
+    """Join `url` to `url_base`, already standardized with its scheme kept,
+    as `prepend_if_relative` does"""
+    if url.startswith('javascript:') or url.startswith('mailto:'):
+        return url
+    url_joined = urljoin(url_base, url)
+    if not keep_anchors:
+        u = parse_url(url_joined)
+        return '{}://{}{}'.format(u.scheme, u.netloc, u.path)
+    return url_joined
+
+
+def is_flat_file(url):
+    """Return True if `url` points to a (potentially large) flat file"""
+    # strip url args:
+    u = parse_url(url)
+    if not u.path:
+        return False
+
+    if '.' not in u.path:
+        return False
+
+    file_type = u.path.split('.')[-1]
+    if file_type in web_extensions:
+        return False
+
+    return True
+
+
+@lru_cache(maxsize=URL_CACHE_SIZE)
+def standardize_url(url, keep_scheme=False):
+    """Standardize `url` string formatting by removing anchors and trailing slashes,
+    and by prepending schemas
+    """
+
+    # special case
+    if url.startswith('javascript:') or url.startswith('mailto:'):
+        return url
+
+    # prepend scheme if necessary
+    if url.startswith('//'):
+        url = 'http:' + url
+    elif '.' in parse_url(url).path.rpartition('/')[2] and not url.startswith('/'):
+        url = ensure_protocol(url)
+
+    # internal links
+    if is_relative_url(url):
+        return url
+
+    # external links
+    u = parse_url(ensure_protocol(url))
+    scheme = u.scheme.replace('https', 'http') if not keep_scheme else u.scheme
+    return '{}://{}{}'.format(scheme, u.netloc, u.path).strip()
+
+
+def standardize_descheme_url(url):
+    url_standardized = standardize_url(url)
+    u = parse_url(ensure_protocol(url_standardized))
+    return '{}{}'.format(u.netloc, u.path)
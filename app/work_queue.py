@@ -0,0 +1,416 @@
+"""Database-backed work queue shared by any number of worker processes"""
+import datetime
+import json
+import os
+import socket
+import threading
+import traceback
+from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
+from . import app, db
+from .globals import WORK_QUEUE, LEASE_SECONDS, HEARTBEAT_SECONDS, WORK_POLL_SECONDS, WORK_MAX_ATTEMPTS, \
+    WORKER_THREADS, OWNER_SCAN_QUOTA, USER_SCAN_QUOTA
+from .models import WorkItem, Lease, Owner
+
+
+def worker_name():
+    """Return a name identifying this process across nodes"""
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def acquire_lease(name, owner, lease_seconds=LEASE_SECONDS):
+    """Take or renew lease `name` for `owner` for `lease_seconds`, if it is free,
+    expired or already held by `owner`. Returns True if `owner` holds the lease"""
+    now = datetime.datetime.utcnow()
+    expires = now + datetime.timedelta(seconds=lease_seconds)
+    held = Lease.query.\
+        filter(Lease.name == name).\
+        filter(or_(Lease.owner == owner, Lease.expires < now)).\
+        update(dict(owner=owner, expires=expires), synchronize_session=False)
+    db.session.commit()
+    if held:
+        return True
+    if Lease.query.get(name) is not None:
+        return False
+    try:
+        db.session.add(Lease(name=name, owner=owner, expires=expires))
+        db.session.commit()
+    except IntegrityError:
+        # another process took the lease first
+        db.session.rollback()
+        return False
+    return True
+
+
+class WorkQueue(object):
+    """Queue of `WorkItem`s named `name`. Workers claim the most urgent item with
+    `SELECT ... FOR UPDATE SKIP LOCKED`, so that they never wait on each other's
+    claims, and lease it for `lease_seconds`. An item whose lease expires, because
+    its worker stopped heartbeating, can be claimed again, until it has been
+    attempted `max_attempts` times.
+    Items are shared fairly between the owners and users they are queued for:
+    within a priority, the owner with the fewest items running per unit of its
+    `scan_weight` goes first, and owners and users with `owner_quota` or
+    `user_quota` items running wait for one to finish. An owner's own
+    `scan_quota` overrides `owner_quota`. The items of one scan job, such as
+    the shards of a sharded scan, count once, and once one of them runs the
+    rest aren't held back by the quotas.
+    Databases without row locks, such as SQLite, fall back on the conditional
+    update that confirms each claim"""
+    def __init__(self, name=WORK_QUEUE, lease_seconds=LEASE_SECONDS, max_attempts=WORK_MAX_ATTEMPTS,
+                 owner_quota=OWNER_SCAN_QUOTA, user_quota=USER_SCAN_QUOTA):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner_quota = owner_quota
+        self.user_quota = user_quota
+
+    def enqueue(self, kind, payload, priority=0, scan_job_id=None, owner_id=None, user_id=None, commit=True):
+        """Add an item of `kind` with JSON-serializable `payload` to the queue, for
+        owner `owner_id` and user `user_id`, working on scan job `scan_job_id` if
+        already known. Items with a higher `priority` are claimed first. With
+        `commit` False, the item is left for the caller to commit"""
+        item = WorkItem(
+            queue=self.name,
+            kind=kind,
+            payload=json.dumps(payload),
+            status='queued',
+            priority=priority,
+            attempts=0,
+            scan_job_id=scan_job_id,
+            owner_id=owner_id,
+            user_id=user_id,
+            created_time=datetime.datetime.utcnow())
+        db.session.add(item)
+        if commit:
+            db.session.commit()
+        return item
+
+    def claimable(self, now):
+        """Return the filter matching items that can be claimed at `now`"""
+        return and_(
+            WorkItem.queue == self.name,
+            or_(
+                and_(
+                    WorkItem.status == 'queued',
+                    or_(WorkItem.not_before == None, WorkItem.not_before <= now)),
+                and_(WorkItem.status == 'leased', WorkItem.lease_expires < now)))
+
+    def leased(self, now):
+        """Return the filter matching items leased to a worker at `now`"""
+        return and_(
+            WorkItem.queue == self.name,
+            WorkItem.status == 'leased',
+            WorkItem.lease_expires >= now)
+
+    def running(self, column, now):
+        """Return a dict of the number of scans running for each value of `column`,
+        counting the items of a scan job once"""
+        scan = db.func.coalesce(WorkItem.scan_job_id, -WorkItem.id)
+        return dict(db.session.query(column, db.func.count(db.distinct(scan))).
+                    filter(self.leased(now)).
+                    group_by(column).
+                    all())
+
+    def candidates(self, now, limit):
+        """Return the IDs of up to `limit` claimable items in the order to claim them:
+        the oldest item of each owner, user and priority, skipping those at their
+        quotas. Quotas are only checked here, so workers claiming at the same
+        moment may briefly exceed them"""
+        heads = db.session.query(WorkItem.owner_id, WorkItem.user_id, WorkItem.priority, db.func.min(WorkItem.id)).\
+            filter(self.claimable(now)).\
+            group_by(WorkItem.owner_id, WorkItem.user_id, WorkItem.priority).\
+            all()
+        head_jobs = dict(
+            db.session.query(WorkItem.id, WorkItem.scan_job_id).
+            filter(WorkItem.id.in_([item_id for _, _, _, item_id in heads])).
+            all()) if heads else {}
+        running_jobs = set(
+            job_id for job_id, in db.session.query(WorkItem.scan_job_id).
+            filter(self.leased(now)).
+            filter(WorkItem.scan_job_id != None).
+            distinct())
+        running_owners = self.running(WorkItem.owner_id, now)
+        running_users = self.running(WorkItem.user_id, now)
+        owners = {
+            owner.id: owner for owner in
+            Owner.query.filter(Owner.id.in_({owner_id for owner_id, _, _, _ in heads if owner_id is not None}))}
+
+        def owner_setting(owner_id, setting, default):
+            owner = owners.get(owner_id)
+            value = getattr(owner, setting) if owner is not None else None
+            return default if value is None else value
+
+        def at_quota(owner_id, user_id, item_id):
+            if head_jobs.get(item_id) in running_jobs:
+                # the job already counts against its quotas
+                return False
+            if owner_id is not None and \
+                    running_owners.get(owner_id, 0) >= owner_setting(owner_id, 'scan_quota', self.owner_quota):
+                return True
+            return user_id is not None and running_users.get(user_id, 0) >= self.user_quota
+
+        def claim_order(head):
+            owner_id, _, priority, item_id = head
+            share = running_owners.get(owner_id, 0) / (owner_setting(owner_id, 'scan_weight', 1) or 1)
+            return -priority, share, item_id
+
+        heads = sorted(
+            (head for head in heads if not at_quota(head[0], head[1], head[3])),
+            key=claim_order)
+        return [item_id for _, _, _, item_id in heads[:limit]]
+
+    def claim(self, worker, candidates=10):
+        """Lease the next claimable item to `worker` and return it, or None if there
+        is none: the most urgent item of the owner with the smallest share of the
+        items running (see `candidates`). Items that have used up their attempts
+        are failed"""
+        now = datetime.datetime.utcnow()
+        order = self.candidates(now, candidates)
+        items = WorkItem.query.\
+            filter(WorkItem.id.in_(order)).\
+            filter(self.claimable(now)).\
+            with_for_update(skip_locked=True).\
+            all() if order else []
+        items.sort(key=lambda item: order.index(item.id))
+        failed = False
+        for item in items:
+            if item.attempts >= self.max_attempts:
+                item.status = 'failed'
+                item.error = item.error or 'Lease expired after {} attempts'.format(item.attempts)
+                item.finished_time = now
+                failed = True
+                continue
+            claimed = WorkItem.query.\
+                filter(WorkItem.id == item.id).\
+                filter(self.claimable(now)).\
+                update(dict(
+                    status='leased',
+                    lease_owner=worker,
+                    lease_expires=now + datetime.timedelta(seconds=self.lease_seconds),
+                    attempts=WorkItem.attempts + 1,
+                ), synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return WorkItem.query.get(item.id)
+        db.session.commit()
+        if failed:
+            # the owners of failed items may have more to claim
+            return self.claim(worker, candidates)
+        return None
+
+    def heartbeat(self, item, worker):
+        """Extend `worker`'s lease on `item`. Returns False if the lease was lost"""
+        extended = WorkItem.query.\
+            filter(WorkItem.id == item.id).\
+            filter(WorkItem.status == 'leased').\
+            filter(WorkItem.lease_owner == worker).\
+            update(dict(
+                lease_expires=datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease_seconds),
+            ), synchronize_session=False)
+        db.session.commit()
+        return bool(extended)
+
+    def complete(self, item, worker):
+        """Mark `item` done, if `worker` still holds its lease. Returns False if the lease was lost"""
+        completed = WorkItem.query.\
+            filter(WorkItem.id == item.id).\
+            filter(WorkItem.status == 'leased').\
+            filter(WorkItem.lease_owner == worker).\
+            update(dict(
+                status='done',
+                lease_expires=None,
+                finished_time=datetime.datetime.utcnow(),
+            ), synchronize_session=False)
+        db.session.commit()
+        return bool(completed)
+
+    def fail(self, item, error, worker):
+        """Record `error` for `item`, and queue it again unless it has used up its
+        attempts, if `worker` still holds its lease. Returns False if the lease was lost"""
+        values = dict(error=error, lease_expires=None)
+        if item.attempts < self.max_attempts:
+            values.update(status='queued')
+        else:
+            values.update(status='failed', finished_time=datetime.datetime.utcnow())
+        failed = WorkItem.query.\
+            filter(WorkItem.id == item.id).\
+            filter(WorkItem.status == 'leased').\
+            filter(WorkItem.lease_owner == worker).\
+            update(values, synchronize_session=False)
+        db.session.commit()
+        return bool(failed)
+
+    def requeue(self, item, worker, delay):
+        """Queue `item` again to be claimed after `delay` seconds, without using up
+        an attempt, if `worker` still holds its lease. Returns False if the lease was lost"""
+        requeued = WorkItem.query.\
+            filter(WorkItem.id == item.id).\
+            filter(WorkItem.status == 'leased').\
+            filter(WorkItem.lease_owner == worker).\
+            update(dict(
+                status='queued',
+                lease_expires=None,
+                not_before=datetime.datetime.utcnow() + datetime.timedelta(seconds=delay),
+                attempts=WorkItem.attempts - 1,
+            ), synchronize_session=False)
+        db.session.commit()
+        return bool(requeued)
+
+    def __len__(self):
+        return WorkItem.query.\
+            filter(WorkItem.queue == self.name).\
+            filter(WorkItem.status.in_(('queued', 'leased'))).\
+            count()
+
+
+class Worker(object):
+    """Runs the items of `queue` in `threads` threads, calling `handlers[item.kind]`
+    with each item's payload, the item itself and an event that is set if the
+    worker loses the item's lease, for the handler to stop on. A handler
+    returning a number of seconds has its item queued again to run after them,
+    rather than done. While an item runs, its lease is extended every
+    `heartbeat_seconds`"""
+    def __init__(self, queue, handlers, name=None, threads=WORKER_THREADS,
+                 heartbeat_seconds=HEARTBEAT_SECONDS, poll_seconds=WORK_POLL_SECONDS):
+        self.queue = queue
+        self.handlers = handlers
+        self.name = name or worker_name()
+        self.threads = threads
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stop claiming items; items already claimed are finished"""
+        self._stopped.set()
+
+    def run(self):
+        """Claim and run items until stopped"""
+        threads = [threading.Thread(target=self.run_thread) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_thread(self):
+        """Worker thread: claim and run items, polling when the queue is empty"""
+        with app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    worked = self.run_once()
+                except Exception as exception:
+                    print('Error while claiming work')
+                    print(exception)
+                    db.session.rollback()
+                    worked = False
+                if not worked:
+                    self._stopped.wait(self.poll_seconds)
+
+    def run_once(self):
+        """Claim and run one item. Returns False if there was none to claim"""
+        item = self.queue.claim(self.name)
+        if item is None:
+            return False
+        print('Worker {} running {}'.format(self.name, item))
+        done = threading.Event()
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self.heartbeat, args=(item.id, done, stopped))
+        heartbeat.start()
+        try:
+            delay = self.handlers[item.kind](json.loads(item.payload), item, stopped)
+        except Exception:
+            error = traceback.format_exc()
+            print(error)
+            db.session.rollback()
+            finished = self.queue.fail(WorkItem.query.get(item.id), error, self.name)
+        else:
+            if delay is not None:
+                finished = self.queue.requeue(WorkItem.query.get(item.id), self.name, delay)
+            else:
+                finished = self.queue.complete(WorkItem.query.get(item.id), self.name)
+        finally:
+            done.set()
+            heartbeat.join()
+        if not finished:
+            # another worker has claimed the item since
+            print('Worker {} lost its lease on {} before finishing it'.format(self.name, item))
+        return True
+
+    def heartbeat(self, item_id, done, stopped):
+        """Extend the lease on item `item_id` until `done` is set. Errors are
+        retried at the next beat; if the lease is lost, `stopped` is set, so
+        that the item's handler stops"""
+        with app.app_context():
+            try:
+                while not done.wait(self.heartbeat_seconds):
+                    try:
+                        item = WorkItem.query.get(item_id)
+                        extended = self.queue.heartbeat(item, self.name)
+                    except Exception as exception:
+                        print('Error while extending the lease on item {}'.format(item_id))
+                        print(exception)
+                        db.session.rollback()
+                        continue
+                    if not extended:
+                        print('Worker {} lost its lease on {}'.format(self.name, item))
+                        stopped.set()
+                        return
+            finally:
+                db.session.remove()
+
+
+class SchedulerLeader(object):
+    """Runs `scheduler`'s jobs in this process only while it holds the lease
+    named `lease`, so that however many worker processes are running, each
+    scheduled job fires once. The lease is renewed every `poll_seconds`, when
+    the scheduler also picks up jobs stored by other processes; if the leader
+    stops, another worker takes over once its lease expires"""
+    def __init__(self, scheduler, name=None, lease='scheduler', lease_seconds=LEASE_SECONDS,
+                 poll_seconds=WORK_POLL_SECONDS):
+        self.scheduler = scheduler
+        self.name = name or worker_name()
+        self.lease = lease
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.leading = False
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Stop leading"""
+        self._stopped.set()
+
+    def run(self):
+        """Take, renew and act on the lease until stopped"""
+        with app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    self.run_once()
+                except Exception as exception:
+                    print('Error while renewing the {} lease'.format(self.lease))
+                    print(exception)
+                    db.session.rollback()
+                    if self.leading:
+                        # the lease may expire before it can be renewed
+                        self.scheduler.pause()
+                        self.leading = False
+                self._stopped.wait(self.poll_seconds)
+            if self.leading:
+                self.scheduler.pause()
+                self.leading = False
+
+    def run_once(self):
+        """Take or renew the lease, and run or pause the scheduler's jobs accordingly.
+        Returns True if this process leads"""
+        leading = acquire_lease(self.lease, self.name, self.lease_seconds)
+        if leading and not self.leading:
+            print('Worker {} is running the scheduler'.format(self.name))
+            self.scheduler.resume()
+        elif not leading and self.leading:
+            print('Worker {} lost the {} lease'.format(self.name, self.lease))
+            self.scheduler.pause()
+        elif leading:
+            # jobs added by other processes aren't announced to this scheduler
+            self.scheduler.scheduler.wakeup()
+        self.leading = leading
+        return leading
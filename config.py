@@ -24,6 +24,9 @@ class Config(object):
         'misfire_grace_time': 300,  # seconds after runtime
     }
     SCHEDULER_API_ENABLED = True
+    # processes that only store scheduled jobs for a worker process to run, such
+    # as web processes, set RUN_SCHEDULER=false
+    RUN_SCHEDULER = os.getenv('RUN_SCHEDULER', 'true').lower() != 'false'
 
 
 class ProductionConfig(Config):
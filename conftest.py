@@ -0,0 +1,33 @@
+"""Fixtures shared by the crawl tests"""
+from os import path
+from unittest.mock import patch
+import pytest
+from app.cache import result_cache
+
+
+@pytest.fixture
+def mock_crawl():
+    """Set up a crawl against mocked hosts: HEAD requests go through
+    `Session.get`, so that patching it covers all requests, requests are not
+    rate limited, and no results are cached from earlier tests"""
+    result_cache.clear()
+    with patch('app.link_check.requests.Session.head', lambda session, url, **kwargs: session.get(url, **kwargs)), \
+            patch('app.politeness.TokenBucket.reserve', return_value=0):
+        yield
+
+
+@pytest.fixture(scope='session')
+def va_directory_html():
+    """Body of the sample VA directory page"""
+    with open(path.join('samples', 'va_directory.html'), 'r') as f:
+        return f.read()
+
+
+@pytest.fixture
+def va_directory_get(va_directory_html):
+    """Patch `Session.get` to answer every request with the sample VA directory page"""
+    with patch('app.link_check.requests.Session.get') as mock_get:
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [va_directory_html.encode()]
+        yield mock_get
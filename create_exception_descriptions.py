@@ -12,12 +12,16 @@ custom_exception_descriptions = {
     'ReadTimeout': 'Host server timeout.',
     'ConnectTimeout': 'Host server timeout.',
     'InvalidSchema': 'Could not read schema.',
+    'BudgetExceeded': 'Not checked: the scan reached its request budget.',
 }
+exception_names += [
+    exception_name for exception_name in custom_exception_descriptions
+    if exception_name not in exception_names]
 
 for exception_name in exception_names:
-    exception = requests.exceptions.__dict__[exception_name]
-    description = custom_exception_descriptions.get(
-        exception_name, exception.__doc__)
+    description = custom_exception_descriptions.get(exception_name)
+    if description is None:
+        description = requests.exceptions.__dict__[exception_name].__doc__
     db.session.add(Exception(
         exception=exception_name,
         exception_description=description
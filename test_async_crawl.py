@@ -0,0 +1,72 @@
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app.async_crawl import AsyncLinkChecker
+from app.link_check import LinkChecker, CrawlStopped
+from app.models import Owner
+
+
+@pytest.mark.usefixtures('mock_crawl')
+class TestAsyncCrawl(object):
+    def setup(self):
+        self.owner = Owner.query.first()
+
+    def crawl(self, checker_class, url, **kwargs):
+        test_checker = checker_class(url, self.owner.user, self.owner, **kwargs)
+        test_checker.check_all_links_and_follow()
+        test_checker.close()
+        results = test_checker.get_results(lambda x: True).all()
+        return test_checker, set(result.url for result in results)
+
+    def test_matches_recursive_crawl(self, va_directory_get):
+        url = 'https://www.va.gov/directory/guide/home.asp'
+        checker, links_checked = self.crawl(LinkChecker, url)
+        async_checker, async_links_checked = self.crawl(AsyncLinkChecker, url)
+        assert async_links_checked == links_checked
+        assert async_checker.links_checked_and_followed == checker.links_checked_and_followed
+        assert async_checker.job.links.count() == checker.job.links.count()
+
+    def test_pages_fetched_once(self, va_directory_get):
+        checker, links_checked = self.crawl(AsyncLinkChecker, 'https://www.va.gov/directory/guide/')
+        urls_requested = [call[0][0] for call in va_directory_get.call_args_list]
+        assert len(urls_requested) == len(set(urls_requested))
+        assert checker.job.link_checks.count() == len(links_checked)
+
+    def test_parse_processes(self, va_directory_get):
+        url = 'https://www.va.gov/directory/guide/'
+        _, links_checked = self.crawl(LinkChecker, url)
+        _, links_checked_parse_processes = self.crawl(AsyncLinkChecker, url, parse_processes=2)
+        assert links_checked_parse_processes == links_checked
+
+    @patch('app.link_check.requests.Session.get')
+    def test_retries(self, mock_get):
+        page = MagicMock(status_code=200, headers={'Content-Type': 'text/html'})
+        page.iter_content.return_value = [b'<a href="http://busy.com/1">busy</a>']
+        attempts = []
+
+        def get(url, **kwargs):
+            if url != 'http://busy.com/1':
+                return page
+            attempts.append(url)
+            return MagicMock(status_code=503 if len(attempts) == 1 else 200, headers={'Retry-After': '0'})
+        mock_get.side_effect = get
+        test_checker = AsyncLinkChecker('https://blog.dummy.com', self.owner.user, self.owner)
+        test_checker.check_all_links_and_follow()
+        result = test_checker.get_results(lambda x: True).filter_by(url='http://busy.com/1').one()
+        assert (result.response, result.attempts) == (200, 2)
+
+    def test_stopped(self, va_directory_get):
+        stopped = threading.Event()
+        checker = AsyncLinkChecker(
+            'https://www.va.gov/directory/guide/', self.owner.user, self.owner, use_cache=False, stopped=stopped)
+        check_all_links_async = checker.check_all_links_async
+
+        async def check_all_links_until_stopped(url, depth=0):
+            stopped.set()
+            return await check_all_links_async(url, depth)
+        checker.check_all_links_async = check_all_links_until_stopped
+        with pytest.raises(CrawlStopped):
+            checker.check_all_links_and_follow()
+        checker.close()
+        # the pages already being followed finish, but no more are started
+        assert len(checker.links_checked_and_followed) == 1
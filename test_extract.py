@@ -0,0 +1,35 @@
+from glob import glob
+from os import path
+from bs4 import BeautifulSoup
+from app.extract import extract_links, unescape_href
+
+
+def soup_links(html):
+    soup = BeautifulSoup(html, 'lxml')
+    return [
+        bytes(a['href'], "utf-8").decode("unicode_escape")
+        for a in soup.find_all('a')
+        if a.has_attr('href')]
+
+
+def test_extract_links_matches_soup():
+    for sample in glob(path.join('samples', '*.html')):
+        with open(sample, 'rb') as f:
+            html = f.read()
+        assert extract_links(html) == soup_links(html)
+        assert extract_links(html.decode('utf-8')) == soup_links(html.decode('utf-8'))
+
+
+def test_extract_links_empty():
+    assert extract_links('') == []
+    assert extract_links(b'') == []
+
+
+def test_extract_links_no_href():
+    assert extract_links('<A NAME="top">top</A><a href="/page">page</a>') == ['/page']
+
+
+def test_unescape_href():
+    assert unescape_href('/page') == '/page'
+    assert unescape_href('\\u00e9') == 'é'
+    assert unescape_href('é') == bytes('é', "utf-8").decode("unicode_escape")
@@ -0,0 +1,61 @@
+import pytest
+from app.frontier import Frontier, shallowest_first, most_linked_first
+
+
+def pop_all(frontier):
+    urls = []
+    while frontier:
+        urls.append(frontier.pop()[0])
+    return urls
+
+
+def test_breadth_first():
+    frontier = Frontier()
+    frontier.push('http://a.com', 0)
+    frontier.push('http://a.com/1', 1)
+    frontier.push('http://a.com/1/1', 2)
+    frontier.push('http://a.com/2', 1)
+    assert pop_all(frontier) == ['http://a.com', 'http://a.com/1', 'http://a.com/1/1', 'http://a.com/2']
+
+
+def test_shallowest_first():
+    frontier = Frontier(shallowest_first)
+    frontier.push('http://a.com/1/1', 2)
+    frontier.push('http://a.com/1', 1)
+    frontier.push('http://a.com/2', 1)
+    frontier.push('http://a.com/1/1', 0)
+    assert frontier.pop() == ('http://a.com/1/1', 0)
+    assert pop_all(frontier) == ['http://a.com/1', 'http://a.com/2']
+
+
+def test_most_linked_first():
+    frontier = Frontier(most_linked_first)
+    frontier.push('http://a.com/1', 1)
+    frontier.push('http://a.com/2', 1)
+    frontier.push('http://a.com/3', 1)
+    frontier.push('http://a.com/3', 2)
+    frontier.push('http://a.com/2', 2)
+    frontier.push('http://a.com/3', 2)
+    assert len(frontier) == 3
+    assert pop_all(frontier) == ['http://a.com/3', 'http://a.com/2', 'http://a.com/1']
+
+
+def test_push_duplicate():
+    frontier = Frontier()
+    frontier.push('http://a.com/1', 1)
+    frontier.push('http://a.com/1', 1)
+    assert 'http://a.com/1' in frontier
+    assert pop_all(frontier) == ['http://a.com/1']
+    with pytest.raises(IndexError):
+        frontier.pop()
+
+
+def test_entries_restore_order():
+    frontier = Frontier(most_linked_first)
+    for url, depth in [('http://a.com/1', 1), ('http://a.com/2', 1), ('http://a.com/2', 2), ('http://a.com/3', 1)]:
+        frontier.push(url, depth)
+    restored = Frontier(most_linked_first)
+    for url, depth, inbound_links in frontier.entries():
+        restored.push(url, depth, inbound_links)
+    assert frontier.entries() == [('http://a.com/1', 1, 1), ('http://a.com/2', 1, 2), ('http://a.com/3', 1, 1)]
+    assert pop_all(restored) == pop_all(frontier)
@@ -0,0 +1,47 @@
+import requests
+from app.hosts import HostHealth
+
+
+def test_timeout_adapts_to_latency():
+    hosts = HostHealth(min_timeout=1, max_timeout=10)
+    assert hosts.timeout('http://a.com/1') == 10
+    hosts.record_latency('http://a.com/1', 0.5)
+    assert hosts.timeout('http://a.com/2') == 1.5
+    for _ in range(20):
+        hosts.record_latency('http://a.com/1', 0.1)
+    assert hosts.timeout('http://a.com/2') == 1
+    # other hosts keep the default timeout
+    assert hosts.timeout('http://b.com') == 10
+
+
+def test_read_timeout_backs_off():
+    hosts = HostHealth(min_timeout=1, max_timeout=10)
+    hosts.record_latency('http://a.com', 0.5)
+    timeout = hosts.timeout('http://a.com')
+    hosts.record_failure('http://a.com', requests.exceptions.ReadTimeout(), timeout)
+    assert hosts.timeout('http://a.com') > timeout
+
+
+def test_circuit_opens_after_consecutive_failures():
+    hosts = HostHealth(max_failures=2)
+    hosts.record_failure('http://a.com/1', requests.exceptions.ConnectTimeout('timed out'), 10)
+    assert hosts.circuit_open_result('http://a.com/2') is None
+    hosts.record_failure('http://a.com/2', requests.exceptions.ConnectTimeout('timed out'), 10)
+    result = hosts.circuit_open_result('http://a.com/3')
+    assert result['exception'] == 'ConnectTimeout'
+    assert 'circuit open' in result['note']
+    assert hosts.circuit_open_result('http://b.com/1') is None
+
+
+def test_circuit_closed_by_success():
+    hosts = HostHealth(max_failures=2)
+    hosts.record_failure('http://a.com/1', requests.exceptions.ConnectionError(), 1)
+    hosts.record_latency('http://a.com/2', 1)
+    hosts.record_failure('http://a.com/3', requests.exceptions.ConnectionError(), 1)
+    assert hosts.circuit_open_result('http://a.com/4') is None
+
+
+def test_ssl_errors_do_not_open_circuit():
+    hosts = HostHealth(max_failures=1)
+    hosts.record_failure('http://a.com/1', requests.exceptions.SSLError(), 1)
+    assert hosts.circuit_open_result('http://a.com/2') is None
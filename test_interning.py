@@ -0,0 +1,35 @@
+from app.interning import UrlTable, UrlSet
+
+
+def test_url_table():
+    urls = UrlTable()
+    assert urls.intern('http://a.com') == 0
+    assert urls.intern('http://a.com/ü') == 1
+    assert urls.intern('http://a.com') == 0
+    assert urls.url(1) == 'http://a.com/ü'
+    assert urls.id('http://a.com/ü') == 1
+    assert urls.id('http://b.com') is None
+    assert 'http://a.com' in urls and len(urls) == 2
+
+
+def test_url_table_grows():
+    urls = UrlTable()
+    links = ['http://a.com/{}'.format(i) for i in range(1000)]
+    assert [urls.intern(link) for link in links] == list(range(1000))
+    assert [urls.id(link) for link in links] == list(range(1000))
+    assert [urls.url(i) for i in range(1000)] == links
+
+
+def test_url_set():
+    urls = UrlTable()
+    visited = UrlSet(urls, ['http://a.com/1', 'http://a.com/2'])
+    visited.add('http://a.com/1')
+    visited.add('http://a.com/20')
+    assert len(visited) == 3
+    assert 'http://a.com/2' in visited
+    assert 'http://a.com/3' not in visited
+    assert set(visited) == {'http://a.com/1', 'http://a.com/2', 'http://a.com/20'}
+    # other sets share the table, and compare by their URLs
+    checked = UrlSet(urls, ['http://a.com/20'])
+    assert 'http://a.com/1' not in checked
+    assert UrlSet(UrlTable(), visited) == visited
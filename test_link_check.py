@@ -1,9 +1,14 @@
+import json
+import os
+import pytest
 from os import path
 from app.link_check import *
 from app.models import Owner
-from unittest.mock import patch
+from app.cache import ResultCache, result_cache
+from unittest.mock import patch, MagicMock
 
 
+@pytest.mark.usefixtures('mock_crawl')
 class TestLinkCheck(object):
     def setup(self):
         self.owner = Owner.query.first()
@@ -66,10 +71,11 @@ class TestLinkCheck(object):
         assert r.response is None
         assert r.exception == "ConnectTimeout"
 
-    @patch('app.link_check.requests.get')
+    @patch('app.link_check.requests.Session.get')
     def test_links_checked_and_followed_single_page(self, mock_get):
         mock_get.return_value.status_code = 404
-        mock_get.return_value.content = self.sample_html
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [self.sample_html.encode()]
         test_checker = LinkChecker(
             'https://blog.dummy.com',
             self.owner.user,
@@ -77,10 +83,11 @@ class TestLinkCheck(object):
         test_checker.check_all_links_and_follow()
         assert len(test_checker.links_checked_and_followed) == 3
 
-    @patch('app.link_check.requests.get')
+    @patch('app.link_check.requests.Session.get')
     def test_links_checked_and_followed_single_page_no_schema(self, mock_get):
         mock_get.return_value.status_code = 404
-        mock_get.return_value.content = self.sample_html
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [self.sample_html.encode()]
         test_checker = LinkChecker(
             'blog.dummy.com',
             self.owner.user,
@@ -92,12 +99,13 @@ class TestLinkCheck(object):
         r = self.test_checker.check_link('http://www.siafoo.net/article/52')
         assert r.response == 200
 
-    @patch('app.link_check.requests.get')
+    @patch('app.link_check.requests.Session.get')
     def test_stokes(self, mock_get):
         with open(path.join('samples', 'stokes.html'), 'r') as f:
             sample_html = f.read()
         mock_get.return_value.status_code = 200
-        mock_get.return_value.content = sample_html
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [sample_html.encode()]
         test_checker = LinkChecker(
             'http://www.stokes4senate.com/forms/shares/new',
             self.owner.user,
@@ -112,12 +120,13 @@ class TestLinkCheck(object):
             'http://www.stokes4senate.com/forms/shares/new',
         ])
 
-    @patch('app.link_check.requests.get')
+    @patch('app.link_check.requests.Session.get')
     def test_dot_asp_va(self, mock_get):
         with open(path.join('samples', 'va.html'), 'r') as f:
             sample_html = f.read()
         mock_get.return_value.status_code = 200
-        mock_get.return_value.content = sample_html
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [sample_html.encode()]
         test_checker = LinkChecker(
             'https://www.va.gov/HEALTHBENEFITS/cost/',
             self.owner.user,
@@ -128,12 +137,7 @@ class TestLinkCheck(object):
         asp_links = [link for link in links_checked if 'copays.asp' in link]
         assert 'http://copays.asp' not in asp_links
 
-    @patch('app.link_check.requests.get')
-    def test_relative_ext_va(self, mock_get):
-        with open(path.join('samples', 'va_directory.html'), 'r') as f:
-            sample_html = f.read()
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.content = sample_html
+    def test_relative_ext_va(self, va_directory_get):
         test_checker = LinkChecker(
             'https://www.va.gov/directory/guide/home.asp',
             self.owner.user,
@@ -144,12 +148,13 @@ class TestLinkCheck(object):
         assert 'http://./PTSD.asp' not in links_checked
         assert 'http://www.va.gov/directory/guide/PTSD.asp' in links_checked
 
-    @patch('app.link_check.requests.get')
+    @patch('app.link_check.requests.Session.get')
     def test_relative_no_dot_slash(self, mock_get):
         with open(path.join('samples', 'va_ptsd.html'), 'r') as f:
             sample_html = f.read()
         mock_get.return_value.status_code = 200
-        mock_get.return_value.content = sample_html
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [sample_html.encode()]
         test_checker = LinkChecker(
             'https://www.va.gov/directory/guide/PTSD.asp',
             self.owner.user,
@@ -160,12 +165,13 @@ class TestLinkCheck(object):
         assert 'http://state_PTSD.cfm?STATE=VI' not in links_checked
         assert 'http://www.va.gov/directory/guide/state_PTSD.cfm' in links_checked
 
-    @patch('app.link_check.requests.get')
+    @patch('app.link_check.requests.Session.get')
     def test_relative_dot_xml(self, mock_get):
         with open(path.join('samples', 'va_recovery.html'), 'r') as f:
             sample_html = f.read()
         mock_get.return_value.status_code = 200
-        mock_get.return_value.content = sample_html
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [sample_html.encode()]
         test_checker = LinkChecker(
             'https://www.va.gov/directory/guide/PTSD.asp',
             self.owner.user,
@@ -173,4 +179,426 @@ class TestLinkCheck(object):
         test_checker.check_all_links_and_follow()
         results = test_checker.get_results(lambda x: True).all()
         links_checked = [result.url for result in results]
-        assert 'http://Major_Communications.xml' not in links_checked
\ No newline at end of file
+        assert 'http://Major_Communications.xml' not in links_checked
+
+    @patch('app.link_check.requests.Session.get')
+    def test_check_links_concurrent_matches_serial(self, mock_get):
+        statuses = {
+            'http://a.dummy.com/1': 200,
+            'http://a.dummy.com/2': 404,
+            'http://b.dummy.com/1': 500,
+        }
+
+        def get(url, **kwargs):
+            if url not in statuses:
+                raise requests.exceptions.ConnectionError('no host')
+            response = MagicMock()
+            response.status_code = statuses[url]
+            response.headers = {}
+            return response
+        mock_get.side_effect = get
+        links = list(statuses) + ['http://c.dummy.com', 'http://a.dummy.com/1']
+
+        results = []
+        for workers in (1, 8):
+            test_checker = LinkChecker(
+                'https://blog.dummy.com',
+                self.owner.user,
+                self.owner,
+                workers=workers)
+            test_checker.check_links(links)
+            results.append([
+                (result.url, result.response, result.exception)
+                for result in test_checker.get_results(lambda x: True).order_by(LinkCheck.id)])
+        assert results[0] == results[1]
+        assert len(results[0]) == 4
+
+    def test_page_limit_follows_breadth_first(self, va_directory_get):
+        test_checker = LinkChecker(
+            'https://www.va.gov/directory/guide/',
+            self.owner.user,
+            self.owner)
+        with patch('app.link_check.PAGE_LIMIT', 2):
+            test_checker.check_all_links_and_follow()
+        assert len(test_checker.links_checked_and_followed) == 3
+        assert 'http://www.va.gov/directory/guide/' in test_checker.links_checked_and_followed
+        # internal links beyond the page limit are checked but not followed
+        links_checked = [result.url for result in test_checker.get_results(lambda x: True)]
+        internal_links_checked = [
+            link for link in links_checked
+            if link.startswith(test_checker.url)]
+        assert len(internal_links_checked) > 2
+
+    def test_pages_fetched_once(self, va_directory_get):
+        test_checker = LinkChecker(
+            'https://www.va.gov/directory/guide/',
+            self.owner.user,
+            self.owner)
+        test_checker.check_all_links_and_follow()
+        urls_requested = [call[0][0] for call in va_directory_get.call_args_list]
+        assert len(urls_requested) == len(set(urls_requested))
+        links_checked = [result.url for result in test_checker.get_results(lambda x: True)]
+        assert len(links_checked) == len(set(links_checked))
+        for url in test_checker.links_checked_and_followed:
+            if url != test_checker.url:
+                assert url in links_checked
+
+    def test_spill_to_disk(self, va_directory_get):
+        results = []
+        for spill_to_disk in (False, True):
+            test_checker = LinkChecker(
+                'https://www.va.gov/directory/guide/',
+                self.owner.user,
+                self.owner,
+                spill_to_disk=spill_to_disk)
+            if spill_to_disk:
+                # spill after a few URLs
+                test_checker.frontier.hot_size = test_checker.links_checked.hot_size = 4
+            test_checker.check_all_links_and_follow()
+            results.append([result.url for result in test_checker.get_results(lambda x: True)])
+            followed = set(test_checker.links_checked_and_followed)
+            # only the results of followed pages that were never checked are kept
+            assert len(test_checker.page_results) <= 1
+            test_checker.close()
+        assert results[1] == results[0]
+        assert len(followed) > 4
+
+    def test_resume_from_checkpoint(self, va_directory_get):
+        url = 'https://www.va.gov/directory/guide/'
+        test_checker = LinkChecker(url, self.owner.user, self.owner, use_cache=False)
+        test_checker.check_all_links_and_follow()
+        links_checked = sorted(result.url for result in test_checker.get_results(lambda x: True))
+
+        # the worker stops while following the 4th page
+        interrupted_checker = LinkChecker(url, self.owner.user, self.owner, use_cache=False, checkpoint_seconds=0)
+        check_all_links = interrupted_checker.check_all_links
+        pages_followed = []
+
+        def check_all_links_until_stopped(url, depth=0):
+            if len(pages_followed) == 3:
+                raise RuntimeError('worker stopped')
+            pages_followed.append(url)
+            return check_all_links(url, depth)
+        interrupted_checker.check_all_links = check_all_links_until_stopped
+        va_directory_get.reset_mock()
+        with pytest.raises(RuntimeError):
+            interrupted_checker.check_all_links_and_follow()
+        urls_requested = set(call[0][0] for call in va_directory_get.call_args_list)
+
+        va_directory_get.reset_mock()
+        resumed_checker = LinkChecker.resume(interrupted_checker.job, use_cache=False)
+        assert resumed_checker.job.id == interrupted_checker.job.id
+        resumed_checker.check_all_links_and_follow()
+        urls_requested_after_resume = set(call[0][0] for call in va_directory_get.call_args_list)
+        assert all(url.endswith('robots.txt') for url in urls_requested & urls_requested_after_resume)
+        assert sorted(result.url for result in resumed_checker.get_results(lambda x: True)) == links_checked
+
+    def test_stopped(self, va_directory_get):
+        stopped = threading.Event()
+        test_checker = LinkChecker(
+            'https://www.va.gov/directory/guide/', self.owner.user, self.owner, use_cache=False, stopped=stopped)
+        check_all_links = test_checker.check_all_links
+        pages_followed = []
+
+        # the worker loses its lease while following the 3rd page
+        def check_all_links_until_stopped(url, depth=0):
+            pages_followed.append(url)
+            if len(pages_followed) == 3:
+                stopped.set()
+            return check_all_links(url, depth)
+        test_checker.check_all_links = check_all_links_until_stopped
+        with pytest.raises(CrawlStopped):
+            test_checker.check_all_links_and_follow()
+        test_checker.close()
+        # the crawl stops before the next page, without checking the pages left
+        assert len(pages_followed) == 3
+        assert len(test_checker.frontier) > 0
+
+    def test_resume_after_records_flushed(self, va_directory_get):
+        url = 'https://www.va.gov/directory/guide/'
+        test_checker = LinkChecker(url, self.owner.user, self.owner, use_cache=False)
+        test_checker.check_all_links_and_follow()
+
+        # the worker checkpoints after the 2nd page, flushes the 3rd page's records
+        # before its next checkpoint is due, then stops while following the 4th page
+        interrupted_checker = LinkChecker(url, self.owner.user, self.owner, use_cache=False, checkpoint_seconds=3600)
+        check_all_links = interrupted_checker.check_all_links
+        pages_followed = []
+
+        def check_all_links_until_stopped(url, depth=0):
+            if len(pages_followed) == 3:
+                interrupted_checker.flush()
+                raise RuntimeError('worker stopped')
+            pages_followed.append(url)
+            internal_links = check_all_links(url, depth)
+            if len(pages_followed) == 2:
+                interrupted_checker.checkpoint()
+            return internal_links
+        interrupted_checker.check_all_links = check_all_links_until_stopped
+        with pytest.raises(RuntimeError):
+            interrupted_checker.check_all_links_and_follow()
+
+        resumed_checker = LinkChecker.resume(interrupted_checker.job, use_cache=False)
+        resumed_checker.check_all_links_and_follow()
+        # pages followed again after resuming aren't recorded twice
+        assert resumed_checker.job.links.count() == test_checker.job.links.count()
+        assert resumed_checker.job.pages.count() == test_checker.job.pages.count()
+        assert resumed_checker.get_results(lambda x: True).count() == test_checker.get_results(lambda x: True).count()
+
+    @pytest.mark.parametrize('spill_file_kept', [True, False])
+    def test_resume_spilled_crawl(self, va_directory_get, spill_file_kept):
+        url = 'https://www.va.gov/directory/guide/'
+        test_checker = LinkChecker(url, self.owner.user, self.owner, use_cache=False)
+        test_checker.check_all_links_and_follow()
+        links_checked = sorted(result.url for result in test_checker.get_results(lambda x: True))
+
+        interrupted_checker = LinkChecker(
+            url, self.owner.user, self.owner, use_cache=False, spill_to_disk=True, checkpoint_seconds=3600)
+        interrupted_checker.frontier.hot_size = 4
+        check_all_links = interrupted_checker.check_all_links
+        pages_followed = []
+
+        def check_all_links_until_stopped(url, depth=0):
+            if len(pages_followed) == 3:
+                raise RuntimeError('worker stopped')
+            pages_followed.append(url)
+            internal_links = check_all_links(url, depth)
+            if len(pages_followed) == 2:
+                interrupted_checker.checkpoint()
+            return internal_links
+        interrupted_checker.check_all_links = check_all_links_until_stopped
+        with pytest.raises(RuntimeError):
+            interrupted_checker.check_all_links_and_follow()
+        # the worker stops without committing the spill file after its checkpoint
+        interrupted_checker.close(keep_spill_file=True)
+        checkpoint = json.loads(interrupted_checker.job.checkpoint)
+        assert 'followed' not in checkpoint
+        assert len(checkpoint['hot_frontier']) <= 4
+        if not spill_file_kept:
+            os.remove(checkpoint['spill_path'])
+
+        resumed_checker = LinkChecker.resume(interrupted_checker.job, use_cache=False)
+        assert (resumed_checker.spill_store.path == checkpoint['spill_path']) == spill_file_kept
+        if spill_file_kept:
+            assert len(resumed_checker.links_checked_and_followed) == 2
+        resumed_checker.check_all_links_and_follow()
+        resumed_checker.close()
+        assert not os.path.exists(checkpoint['spill_path'])
+        assert sorted(result.url for result in resumed_checker.get_results(lambda x: True)) == links_checked
+        assert resumed_checker.job.links.count() == test_checker.job.links.count()
+
+    def test_request_budget(self, va_directory_get):
+        test_checker = LinkChecker(
+            'https://www.va.gov/directory/guide/',
+            self.owner.user,
+            self.owner,
+            request_budget=20)
+        test_checker.check_all_links_and_follow()
+        results = test_checker.get_results(lambda x: True).all()
+        requested = [result for result in results if result.exception != 'BudgetExceeded']
+        assert len(requested) <= 20
+        assert len(requested) < len(results)
+        # links left unchecked are not reported as broken
+        assert all(result.severity == 0 for result in results if result not in requested)
+
+    @patch('app.link_check.requests.Session.get')
+    def test_circuit_breaker(self, mock_get):
+        mock_get.side_effect = requests.exceptions.ConnectionError('connection refused')
+        test_checker = LinkChecker(
+            'https://blog.dummy.com',
+            self.owner.user,
+            self.owner,
+            workers=1)
+        links = ['http://dead.com/{}'.format(i) for i in range(10)]
+        test_checker.check_links(links)
+        assert mock_get.call_count == test_checker.hosts.max_failures
+        results = test_checker.get_results(lambda x: True).all()
+        assert len(results) == len(links)
+        assert all(result.exception == 'ConnectionError' for result in results)
+        assert len([result for result in results if 'circuit open' in result.note]) == \
+            len(links) - test_checker.hosts.max_failures
+
+    @patch('app.link_check.requests.Session.get')
+    def test_page_fetch_timeout(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        mock_get.return_value.iter_content.return_value = [self.sample_html.encode()]
+        test_checker = LinkChecker('https://blog.dummy.com', self.owner.user, self.owner)
+        # a fast host's links get a short timeout, but its pages are still given the full timeout
+        for _ in range(10):
+            test_checker.hosts.record_latency('https://blog.dummy.com', 0.01)
+        assert test_checker.hosts.timeout('https://blog.dummy.com/a') < GET_TIMEOUT
+        page = test_checker.fetch_page('https://blog.dummy.com/a')
+        assert page.html
+        assert mock_get.call_args[1]['timeout'] == GET_TIMEOUT
+
+    @patch('app.link_check.requests.Session.get')
+    def test_retry_transient_failures(self, mock_get):
+        busy, ok, missing = MagicMock(status_code=503, headers={}), MagicMock(status_code=200), MagicMock(status_code=404)
+        responses = {
+            'http://busy.com/1': [busy, ok],
+            'http://busy.com/2': [busy, busy, busy, busy],
+            'http://missing.com/1': [missing, ok],
+        }
+        mock_get.side_effect = lambda url, **kwargs: responses[url].pop(0)
+        test_checker = LinkChecker(
+            'https://blog.dummy.com',
+            self.owner.user,
+            self.owner,
+            max_attempts=3)
+        test_checker.retry_policy.backoff = 0.01
+        test_checker.check_links(list(responses))
+        test_checker.check_retries(wait=True)
+        results = {result.url: result for result in test_checker.get_results(lambda x: True)}
+        assert (results['http://busy.com/1'].response, results['http://busy.com/1'].attempts) == (200, 2)
+        assert (results['http://busy.com/2'].response, results['http://busy.com/2'].attempts) == (503, 3)
+        assert (results['http://missing.com/1'].response, results['http://missing.com/1'].attempts) == (404, 1)
+        # transient failures are not cached for other jobs
+        assert result_cache.get('http://busy.com/2') is None
+
+    def test_group_links_under_root(self):
+        links = ['/a', 'https://other.com/x', '../up', '/a', '"/b"', 'https://other.com/x', '/a#top']
+        internal_links, external_links = group_links_under_root(
+            links, 'https://blog.dummy.com/posts/1', 'http://blog.dummy.com/posts')
+        assert internal_links == []
+        assert external_links == [
+            'https://other.com/x', 'https://other.com/x',
+            'http://blog.dummy.com/a', 'http://blog.dummy.com/up', 'http://blog.dummy.com/a',
+            'http://blog.dummy.com/b', 'http://blog.dummy.com/a']
+        internal_links, external_links = group_links_internal_external(links, 'https://blog.dummy.com/posts/1')
+        assert internal_links == [
+            'http://blog.dummy.com/a', 'http://blog.dummy.com/up', 'http://blog.dummy.com/a',
+            'http://blog.dummy.com/b', 'http://blog.dummy.com/a']
+        assert external_links == ['https://other.com/x', 'https://other.com/x']
+
+    def test_session_pools_connections_per_host(self):
+        adapter = self.test_checker.session.get_adapter('https://stripe.com/blog')
+        assert adapter is self.test_checker.session.get_adapter('http://stripe.com')
+        assert adapter._pool_maxsize == self.test_checker.host_concurrency
+        assert self.test_checker.session.headers['User-Agent'] == headers['User-Agent']
+
+    @patch('app.link_check.requests.Session.get')
+    def test_check_link_dedupe(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {'Content-Type': 'text/html'}
+        assert self.test_checker.check_link('http://dummy.com/page').response == 200
+        assert self.test_checker.check_link('http://dummy.com/page') is None
+        assert mock_get.call_count == 1
+        self.test_checker.flush()
+
+        test_checker = LinkChecker('https://stripe.com/blog', self.owner.user, self.owner)
+        test_checker.job = self.test_checker.job
+        test_checker.load_links_checked()
+        assert test_checker.is_checked('http://dummy.com/page')
+
+    def test_records_buffered_until_flush(self):
+        self.test_checker.writer.max_seconds = 60
+        self.test_checker.record_link_check('http://dummy.com/page', dict(response=200))
+        self.test_checker.persist_links([], ['http://dummy.com/page'], 'http://dummy.com')
+        assert self.test_checker.job.link_checks.count() == 0
+        assert self.test_checker.job.links.count() == 0
+        assert len(self.test_checker.get_results(lambda x: True).all()) == 1
+        assert self.test_checker.job.links.count() == 1
+
+    @patch('app.link_check.requests.Session.get')
+    def test_incremental_rescan(self, mock_get, va_directory_html):
+        def get(url, headers=None, **kwargs):
+            response = MagicMock()
+            if headers and headers.get('If-None-Match') == '"v1"':
+                response.status_code = 304
+                response.iter_content.return_value = []
+            else:
+                response.status_code = 200
+                response.iter_content.return_value = [va_directory_html.encode()]
+            response.headers = {'ETag': '"v1"'}
+            return response
+        mock_get.side_effect = get
+
+        results = []
+        previous_job = None
+        for _ in range(2):
+            test_checker = LinkChecker(
+                'https://www.va.gov/directory/guide/',
+                self.owner.user,
+                self.owner,
+                previous_job=previous_job)
+            test_checker.check_all_links_and_follow()
+            previous_job = test_checker.job
+            results.append((
+                set((result.url, result.response) for result in test_checker.get_results(lambda x: True)),
+                sorted((link.url, link.source_url) for link in test_checker.job.links),
+            ))
+        assert results[0] == results[1]
+        assert previous_job.pages.count() > 1
+        assert all(page.response == 200 for page in previous_job.pages)
+        conditional_requests = [
+            call for call in mock_get.call_args_list
+            if call[1].get('headers', {}).get('If-None-Match')]
+        assert len(conditional_requests) == previous_job.pages.count()
+
+    @patch('app.link_check.requests.Session.get')
+    def test_result_cache_across_jobs(self, mock_get):
+        mock_get.return_value.status_code = 200
+        assert not self.test_checker.check_link('http://dummy.com/page').cached
+        test_checker = LinkChecker('https://stripe.com/blog', self.owner.user, self.owner)
+        assert test_checker.check_link('http://dummy.com/page').cached
+        assert mock_get.call_count == 1
+        test_checker = LinkChecker('https://stripe.com/blog', self.owner.user, self.owner, use_cache=False)
+        assert not test_checker.check_link('http://dummy.com/page').cached
+        assert mock_get.call_count == 2
+
+    def test_result_cache_ttl_and_eviction(self):
+        cache = ResultCache(max_size=2, ttl=60, negative_ttl=0)
+        cache.put('http://a.com', dict(response=200))
+        cache.put('http://b.com', dict(response=404))
+        assert cache.get('http://a.com') == dict(response=200)
+        assert cache.get('http://b.com') is None
+        cache.put('http://c.com', dict(response=301))
+        cache.get('http://a.com')
+        cache.put('http://d.com', dict(response=200))
+        assert cache.get('http://c.com') is None
+        assert cache.get('http://a.com') is not None
+        cache.ttl = -1
+        cache.put('http://e.com', dict(response=200))
+        assert cache.get('http://e.com') is None
+
+    @patch('app.link_check.requests.Session.head')
+    @patch('app.link_check.requests.Session.get')
+    def test_head_first(self, mock_get, mock_head):
+        mock_head.return_value.status_code = 200
+        mock_get.return_value.status_code = 200
+        assert self.test_checker.check_link('http://dummy.com/page1').response == 200
+        assert mock_head.call_count == 1
+        assert mock_get.call_count == 0
+
+        # fall back to GET for the rest of the job once the host rejects HEAD
+        mock_head.return_value.status_code = 405
+        assert self.test_checker.check_link('http://dummy.com/page2').response == 200
+        assert self.test_checker.check_link('http://dummy.com/page3').response == 200
+        assert mock_head.call_count == 2
+        assert mock_get.call_count == 2
+
+        # hosts known to answer HEAD wrongly are sent GET requests
+        assert self.test_checker.check_link('https://www.linkedin.com/in/dummy').response == 200
+        assert mock_head.call_count == 2
+
+    def test_read_html_content_type(self):
+        response = MagicMock()
+        response.headers = {'Content-Type': 'video/mp4'}
+        assert read_html(response) is None
+        assert not response.iter_content.called
+        response.headers = {'Content-Type': 'text/html; charset=utf-8'}
+        response.iter_content.return_value = [b'<a href="/page">', b'page</a>']
+        assert read_html(response) == b'<a href="/page">page</a>'
+        response.headers = {}
+        assert read_html(response) == b'<a href="/page">page</a>'
+
+    def test_read_html_max_bytes(self):
+        response = MagicMock()
+        response.headers = {'Content-Type': 'text/html', 'Content-Length': '1000'}
+        assert read_html(response, max_bytes=100) is None
+        assert not response.iter_content.called
+        response.headers = {'Content-Type': 'text/html'}
+        response.iter_content.return_value = [b'x' * 60, b'x' * 60]
+        assert read_html(response, max_bytes=100) is None
+        assert read_html(response, max_bytes=120) == b'x' * 120
@@ -0,0 +1,58 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from app.politeness import TokenBucket, PolitenessScheduler, BudgetExceeded
+
+
+def robots_session(status_code=200, text=''):
+    session = MagicMock()
+    session.get.return_value.status_code = status_code
+    session.get.return_value.text = text
+    return session
+
+
+@patch('app.politeness.time.time', return_value=100.0)
+def test_token_bucket_burst(mock_time):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    # further requests are spaced out at the bucket's rate
+    assert [bucket.reserve() for _ in range(3)] == [0.5, 1.0, 1.5]
+
+
+@patch('app.politeness.time.time')
+def test_token_bucket_refills(mock_time):
+    mock_time.return_value = 100.0
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert [bucket.reserve() for _ in range(2)] == [0, 0]
+    mock_time.return_value = 100.5
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0.5
+    mock_time.return_value = 110.0
+    assert [bucket.reserve() for _ in range(2)] == [0, 0]
+
+
+def test_robots_crawl_delay():
+    session = robots_session(text='User-agent: *\nCrawl-delay: 2\n')
+    politeness = PolitenessScheduler('https://a.com/blog', session, rate=10, burst=10)
+    site_bucket = politeness.bucket('a.com')
+    assert (site_bucket.rate, site_bucket.capacity) == (0.5, 1)
+    session.get.assert_called_once()
+    assert session.get.call_args[0][0] == 'https://a.com/robots.txt'
+    # other hosts get the default rate, without requesting their robots.txt
+    other_bucket = politeness.bucket('b.com')
+    assert (other_bucket.rate, other_bucket.capacity) == (10, 10)
+    assert politeness.bucket('a.com') is site_bucket
+    session.get.assert_called_once()
+
+
+def test_robots_missing():
+    politeness = PolitenessScheduler('https://a.com', robots_session(status_code=404), rate=10, burst=5)
+    bucket = politeness.bucket('a.com')
+    assert (bucket.rate, bucket.capacity) == (10, 5)
+
+
+def test_request_budget():
+    politeness = PolitenessScheduler('https://a.com', robots_session(), budget=2)
+    politeness.reserve('https://a.com/1')
+    politeness.reserve('https://b.com/1')
+    with pytest.raises(BudgetExceeded):
+        politeness.reserve('https://a.com/2')
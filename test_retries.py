@@ -0,0 +1,52 @@
+import datetime
+from email.utils import format_datetime
+from unittest.mock import patch
+from app.retries import RetryPolicy, RetryQueue, parse_retry_after
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    date = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=60)
+    assert 55 < parse_retry_after(format_datetime(date, usegmt=True)) <= 60
+
+
+def test_retryable_results():
+    policy = RetryPolicy()
+    assert policy.is_retryable(dict(response=503))
+    assert policy.is_retryable(dict(response=429))
+    assert policy.is_retryable(dict(note='', exception='ReadTimeout'))
+    assert not policy.is_retryable(dict(response=404))
+    assert not policy.is_retryable(dict(note='', exception='ConnectionError'))
+
+
+def test_backoff_with_jitter():
+    policy = RetryPolicy(max_attempts=4, backoff=1, max_delay=30)
+    for attempts in range(1, 4):
+        assert 0 <= policy.delay(dict(response=503), attempts) <= 2 ** (attempts - 1)
+    assert policy.delay(dict(response=503), 4) is None
+    assert policy.delay(dict(response=200), 1) is None
+
+
+def test_retry_after():
+    policy = RetryPolicy(backoff=1, max_delay=30)
+    assert policy.delay(dict(response=429), 1, retry_after=10) == 10
+    # a server asking for too long a wait is not retried
+    assert policy.delay(dict(response=429), 1, retry_after=300) is None
+
+
+@patch('app.retries.time.time')
+def test_retry_queue(mock_time):
+    mock_time.return_value = 100
+    retries = RetryQueue()
+    retries.push('http://a.com/2', 2)
+    retries.push('http://a.com/1', 1)
+    assert 'http://a.com/1' in retries and len(retries) == 2
+    assert retries.pop_due() == []
+    assert retries.next_due() == 101
+    mock_time.return_value = 101.5
+    assert retries.pop_due() == ['http://a.com/1']
+    mock_time.return_value = 105
+    assert retries.pop_due() == ['http://a.com/2']
+    assert not retries and retries.next_due() is None
@@ -0,0 +1,151 @@
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+import pytest
+from unittest.mock import patch
+from app import app, db
+from app.api import resume_stale_scans, run_scan, run_scan_item
+from app.link_check import LinkChecker
+from app.models import Owner, ScanJob, WorkItem
+from app.urls import standardize_descheme_url
+from app.work_queue import WorkQueue
+
+
+def in_thread(func, *args):
+    """Call `func` on a thread of its own, in an app context, as the scheduler
+    and workers do, so that the app context it pushes doesn't end this thread's
+    session"""
+    def run():
+        with app.app_context():
+            func(*args)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+def stopped_worker(func, *args):
+    """Call `func` as a worker that stops with an error partway through it does"""
+    try:
+        func(*args)
+    except RuntimeError:
+        pass
+
+
+@pytest.mark.usefixtures('mock_crawl', 'va_directory_get')
+class TestScan(object):
+    def setup(self):
+        self.owner = Owner.query.first()
+        self.url = 'https://www.va.gov/directory/guide/'
+
+    @patch('app.api.scheduler')
+    @patch('app.api.CHECKPOINT_STALE_SECONDS', 0.25)
+    @patch('app.link_check.UNFOLLOWED_BATCH_SIZE', 2)
+    @patch('app.link_check.PAGE_LIMIT', 2)
+    def test_slow_final_phase_not_stale(self, mock_scheduler):
+        test_checker = LinkChecker(
+            self.url, self.owner.user, self.owner, use_cache=False, workers=1, checkpoint_seconds=0.01)
+        check_link = test_checker.check_link
+        unfollowed_links = test_checker.unfollowed_links
+        batches = []
+
+        def unfollowed_links_in_batches(limit=None):
+            checkpoint = json.loads(test_checker.job.checkpoint)
+            batches.append(len(checkpoint['frontier']))
+            return unfollowed_links(limit)
+
+        # the links left at the page limit are slow to check, and the scheduler
+        # looks for stale scans all along
+        def slow_check_link(link):
+            if batches:
+                time.sleep(0.05)
+                in_thread(resume_stale_scans)
+            return check_link(link)
+        test_checker.unfollowed_links = unfollowed_links_in_batches
+        test_checker.check_link = slow_check_link
+        start = time.time()
+        test_checker.check_all_links_and_follow()
+        test_checker.close()
+        assert time.time() - start > 0.25
+        # the links left are kept in the checkpoint until they are checked
+        assert len(batches) > 1
+        assert batches == sorted(batches, reverse=True) and batches[-1] > 0
+        db.session.refresh(test_checker.job)
+        assert (test_checker.job.status, test_checker.job.resumes) == ('in progress', None)
+
+    def test_resume_spilled_scan(self):
+        test_checker = LinkChecker(self.url, self.owner.user, self.owner, use_cache=False)
+        test_checker.check_all_links_and_follow()
+        test_checker.close()
+        links_checked = sorted(result.url for result in test_checker.get_results(lambda x: True))
+
+        # the worker stops while following the 4th page
+        interrupted_checker = LinkChecker(
+            self.url, self.owner.user, self.owner, use_cache=False, spill_to_disk=True, checkpoint_seconds=0)
+        check_all_links = interrupted_checker.check_all_links
+        pages_followed = []
+
+        def check_all_links_until_stopped(url, depth=0):
+            if len(pages_followed) == 3:
+                raise RuntimeError('worker stopped')
+            pages_followed.append(url)
+            return check_all_links(url, depth)
+        interrupted_checker.check_all_links = check_all_links_until_stopped
+        with pytest.raises(RuntimeError):
+            run_scan(interrupted_checker)
+        checkpoint = json.loads(interrupted_checker.job.checkpoint)
+        assert os.path.exists(checkpoint['spill_path'])
+
+        # the resumed scan continues from the spill file, and deletes it once completed
+        resumed_checker = LinkChecker.resume(interrupted_checker.job, use_cache=False)
+        assert resumed_checker.spill_store.path == checkpoint['spill_path']
+        assert len(resumed_checker.links_checked_and_followed) == 3
+        run_scan(resumed_checker)
+        assert not os.path.exists(checkpoint['spill_path'])
+        assert resumed_checker.job.status == 'completed'
+        assert sorted(result.url for result in resumed_checker.get_results(lambda x: True)) == links_checked
+
+    def test_reclaimed_scan_keeps_options(self):
+        previous_job = ScanJob(
+            root_url=standardize_descheme_url(self.url), start_time=datetime.datetime.utcnow(),
+            user=self.owner.user, owner=self.owner, status='completed')
+        db.session.add(previous_job)
+        db.session.commit()
+        item = WorkQueue('test-{}'.format(uuid.uuid4())).enqueue('scan', dict(
+            url=self.url, owner_id=self.owner.id, user_id=self.owner.user_id, email=True, incremental=True))
+        runs = []
+
+        # the worker stops before the scan's first checkpoint
+        def run_scan_until_stopped(checker, email=False):
+            runs.append((checker.job.id, email, checker.previous_job.id))
+        with patch('app.api.run_scan', run_scan_until_stopped):
+            in_thread(run_scan_item, json.loads(item.payload), item)
+            db.session.refresh(item)
+            in_thread(run_scan_item, json.loads(item.payload), item)
+        # the worker reclaiming the item resumes the same scan, with its options
+        assert runs == [(item.scan_job_id, True, previous_job.id)] * 2
+
+    @patch('app.api.USE_WORK_QUEUE', True)
+    def test_sharded_scan_queued_with_its_job(self):
+        item = WorkQueue('test-{}'.format(uuid.uuid4())).enqueue('scan', dict(
+            url=self.url, owner_id=self.owner.id, user_id=self.owner.user_id, shards=2))
+        jobs = ScanJob.query.count()
+        # the worker stops after creating the job, before queueing its shards
+        with patch('app.api.WorkQueue.enqueue', side_effect=RuntimeError('worker stopped')):
+            in_thread(stopped_worker, run_scan_item, json.loads(item.payload), item)
+        db.session.refresh(item)
+        assert (ScanJob.query.count(), item.scan_job_id) == (jobs, None)
+
+        # the worker reclaiming the item shards the job, and any later attempt leaves it be
+        for _ in range(2):
+            in_thread(run_scan_item, json.loads(item.payload), item)
+            db.session.refresh(item)
+        assert ScanJob.query.count() == jobs + 1
+        shard_items = WorkItem.query.\
+            filter(WorkItem.scan_job_id == item.scan_job_id).\
+            filter(WorkItem.kind == 'scan_shard').\
+            order_by(WorkItem.id).\
+            all()
+        assert [json.loads(shard_item.payload)['shard'] for shard_item in shard_items] == [0, 1]
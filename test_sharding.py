@@ -0,0 +1,72 @@
+import pytest
+from unittest.mock import patch
+from app.link_check import LinkChecker
+from app.sharding import ShardedLinkChecker, start_sharded_job, url_shard
+from app.models import Owner, Page, CrawlUrl, LinkCheck
+
+
+def test_url_shard():
+    shards = [url_shard('https://a.com/{}'.format(i), 4) for i in range(100)]
+    assert set(shards) == {0, 1, 2, 3}
+    assert url_shard('https://a.com/1', 4) == shards[1]
+
+
+@pytest.mark.usefixtures('mock_crawl', 'va_directory_get')
+class TestShardedLinkChecker(object):
+    def setup(self):
+        self.owner = Owner.query.first()
+        self.url = 'https://www.va.gov/directory/guide/'
+
+    def crawl(self, shards, **kwargs):
+        """Run the job's shards in turn, as workers would, until one completes the job"""
+        job = start_sharded_job(self.url, self.owner.user, self.owner, shards)
+        while True:
+            for shard in range(shards):
+                checker = ShardedLinkChecker(
+                    self.url, self.owner.user, self.owner, shard, shards, job, use_cache=False, batch_size=10,
+                    **kwargs)
+                checker.check_all_links_and_follow()
+                checker.close()
+                if checker.finish_job():
+                    return checker
+
+    def test_sharded_crawl(self):
+        test_checker = LinkChecker(self.url, self.owner.user, self.owner, use_cache=False)
+        test_checker.check_all_links_and_follow()
+        links_checked = set(result.url for result in test_checker.get_results(lambda x: True))
+        test_checker.close()
+
+        sharded_checker = self.crawl(3)
+        results = [result.url for result in sharded_checker.get_results(lambda x: True)]
+        # each URL is checked once, by one of the shards
+        assert len(results) == len(set(results))
+        assert set(results) - {sharded_checker.url} == links_checked - {sharded_checker.url}
+        crawl_urls = sharded_checker.job.crawl_urls.all()
+        assert {crawl_url.shard for crawl_url in crawl_urls} == {0, 1, 2}
+        assert all(crawl_url.status == 'done' for crawl_url in crawl_urls)
+        assert sharded_checker.job.status == 'completed'
+
+    @patch('app.link_check.PAGE_LIMIT', 3)
+    @patch('app.sharding.PAGE_LIMIT', 3)
+    def test_page_limit(self):
+        test_checker = LinkChecker(self.url, self.owner.user, self.owner, use_cache=False)
+        test_checker.check_all_links_and_follow()
+        test_checker.close()
+        sharded_checker = self.crawl(2)
+        # the page limit holds across shards: as in an unsharded crawl, the root
+        # page and PAGE_LIMIT more are followed; the pages left over are still checked
+        assert Page.query.filter(Page.job == sharded_checker.job).count() == 3 + 1
+        assert sharded_checker.job.pages_followed == len(test_checker.links_checked_and_followed) == 3 + 1
+        follow_urls = sharded_checker.job.crawl_urls.filter(CrawlUrl.follow == True).count()
+        assert follow_urls > 4
+        assert sharded_checker.get_results(lambda x: True).count() == sharded_checker.job.crawl_urls.count()
+
+    def test_request_budget(self, va_directory_get):
+        # each run of a shard stops at the budget left for the whole job
+        sharded_checker = self.crawl(2, request_budget=10)
+        urls_requested = [
+            call[0][0] for call in va_directory_get.call_args_list if not call[0][0].endswith('robots.txt')]
+        assert len(urls_requested) == 10
+        assert sharded_checker.job.requests_reserved == 10
+        results = sharded_checker.get_results(lambda x: True)
+        assert results.filter(LinkCheck.exception == 'BudgetExceeded').count() == results.count() - 10
@@ -0,0 +1,88 @@
+import random
+import pytest
+from app.frontier import Frontier, breadth_first, shallowest_first, most_linked_first
+from app.spill import BloomFilter, SpillStore, DiskFrontier, DiskUrlSet
+
+
+class TestSpill(object):
+    def setup(self):
+        self.store = SpillStore()
+
+    def teardown(self):
+        self.store.close()
+
+    @pytest.mark.parametrize('priority', [breadth_first, shallowest_first, most_linked_first])
+    def test_frontier_order_matches_memory(self, priority):
+        frontier = Frontier(priority)
+        disk_frontier = DiskFrontier(self.store, priority, hot_size=8)
+        rng = random.Random(priority.__name__)
+        popped = []
+        disk_popped = []
+        for _ in range(500):
+            if rng.random() < 0.7:
+                url, depth = 'http://a.com/{}'.format(rng.randrange(200)), rng.randrange(5)
+                frontier.push(url, depth)
+                disk_frontier.push(url, depth)
+            elif frontier:
+                popped.append(frontier.pop())
+                disk_popped.append(disk_frontier.pop())
+            assert len(disk_frontier) == len(frontier)
+        while frontier:
+            popped.append(frontier.pop())
+            disk_popped.append(disk_frontier.pop())
+        assert disk_popped == popped
+        with pytest.raises(IndexError):
+            disk_frontier.pop()
+
+    def test_frontier_contains_spilled(self):
+        disk_frontier = DiskFrontier(self.store, hot_size=2)
+        for i in range(10):
+            disk_frontier.push('http://a.com/{}'.format(i))
+        assert all('http://a.com/{}'.format(i) in disk_frontier for i in range(10))
+        assert 'http://a.com/10' not in disk_frontier
+
+    def test_url_set(self):
+        visited = DiskUrlSet(self.store, 'visited', hot_size=2)
+        urls = ['http://a.com/{}'.format(i) for i in range(10)]
+        visited.update(urls + urls[:3])
+        assert len(visited) == 10
+        assert all(url in visited for url in urls)
+        assert 'http://a.com/10' not in visited
+        assert list(visited) == urls
+        assert visited == set(urls)
+
+    def test_reopen_at_commit(self):
+        frontier = Frontier(most_linked_first)
+        disk_frontier = DiskFrontier(self.store, most_linked_first, hot_size=4)
+        visited = DiskUrlSet(self.store, 'visited', hot_size=2)
+        for i in range(20):
+            url = 'http://a.com/{}'.format(i % 13)
+            frontier.push(url, i)
+            disk_frontier.push(url, i)
+            visited.add(url)
+        self.store.commit()
+        hot_entries = disk_frontier.hot_entries()
+        # changes after the commit are lost when the store is reopened
+        disk_frontier.pop()
+        visited.add('http://b.com')
+        self.store.db.close()
+
+        self.store = SpillStore(path=self.store.path)
+        disk_frontier = DiskFrontier(self.store, most_linked_first, hot_size=4)
+        disk_frontier.restore(hot_entries)
+        visited = DiskUrlSet(self.store, 'visited', hot_size=2)
+        assert len(visited) == 13 and 'http://a.com/12' in visited and 'http://b.com' not in visited
+        visited.discard('http://a.com/12')
+        assert len(visited) == 12 and 'http://a.com/12' not in visited
+        frontier.push('http://a.com/new')
+        disk_frontier.push('http://a.com/new')
+        assert [disk_frontier.pop() for _ in range(14)] == [frontier.pop() for _ in range(14)]
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000)
+    for i in range(1000):
+        bloom.add('http://a.com/{}'.format(i))
+    assert all('http://a.com/{}'.format(i) in bloom for i in range(1000))
+    false_positives = sum('http://b.com/{}'.format(i) in bloom for i in range(10000))
+    assert false_positives < 300
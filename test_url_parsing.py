@@ -1,4 +1,5 @@
 from app.link_check import *
+from app.urls import is_relative_url
 
 
 def test_get_all_links_len_8P():
@@ -278,4 +279,12 @@ def test_remove_web_extensions():
     assert remove_web_extensions('https://test.htm') == 'https://test'
     assert remove_web_extensions('https://test.asp') == 'https://test'
     assert remove_web_extensions('https://test.aspx') == 'https://test'
-    assert remove_web_extensions('https://test.com') == 'https://test.com'
\ No newline at end of file
+    assert remove_web_extensions('https://test.com') == 'https://test.com'
+
+def test_is_relative_url():
+    assert is_relative_url('/about')
+    assert is_relative_url('about.html')
+    assert is_relative_url('http:about')
+    assert not is_relative_url('https://a.com/about')
+    assert not is_relative_url('//a.com/about')
+    assert not is_relative_url('mailto:a@a.com')
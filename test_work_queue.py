@@ -0,0 +1,213 @@
+import datetime
+import json
+import time
+import uuid
+from unittest.mock import MagicMock
+from app import db
+from app.models import WorkItem, Lease, Owner, User, ScanJob
+from app.work_queue import WorkQueue, Worker, SchedulerLeader, acquire_lease
+
+
+class TestWorkQueue(object):
+    def setup(self):
+        # a queue of its own for each test
+        self.queue = WorkQueue('test-{}'.format(uuid.uuid4()), lease_seconds=60, max_attempts=2)
+
+    def expire_lease(self, item):
+        item.lease_expires = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        db.session.commit()
+
+    def test_claim_by_priority(self):
+        self.queue.enqueue('scan', dict(url='a.com'))
+        urgent = self.queue.enqueue('scan', dict(url='b.com'), priority=1)
+        item = self.queue.claim('worker-1')
+        assert item.id == urgent.id
+        assert (item.status, item.lease_owner, item.attempts) == ('leased', 'worker-1', 1)
+        assert self.queue.claim('worker-2').payload == '{"url": "a.com"}'
+        assert self.queue.claim('worker-3') is None
+        assert len(self.queue) == 2
+
+    def add_owner(self, **kwargs):
+        user = User.query.first()
+        owner = Owner(email=str(uuid.uuid4())[:32], user=user, **kwargs)
+        db.session.add(owner)
+        db.session.commit()
+        return owner
+
+    def enqueue_for(self, owner, n, priority=0):
+        return [
+            self.queue.enqueue('scan', dict(owner=owner.id), priority, owner_id=owner.id, user_id=owner.user_id)
+            for _ in range(n)]
+
+    def claimed_owners(self, n):
+        return [json.loads(self.queue.claim('worker').payload)['owner'] for _ in range(n)]
+
+    def test_fair_between_owners(self):
+        big, small, heavy = self.add_owner(), self.add_owner(), self.add_owner(scan_weight=2)
+        self.queue.owner_quota = 10
+        self.enqueue_for(big, 4)
+        self.enqueue_for(heavy, 4)
+        self.enqueue_for(small, 1)
+        # each owner gets a turn before any gets a second, however early it queued;
+        # an owner with twice the weight gets twice the turns
+        assert self.claimed_owners(5) == [big.id, heavy.id, small.id, heavy.id, big.id]
+
+    def test_quotas_and_priority(self):
+        big, small = self.add_owner(), self.add_owner(scan_quota=1)
+        self.enqueue_for(big, 3)
+        self.enqueue_for(small, 2)
+        interactive, = self.enqueue_for(small, 1, priority=10)
+        assert self.queue.claim('worker').id == interactive.id
+        # both owners stop at their quotas
+        assert self.claimed_owners(2) == [big.id, big.id]
+        assert self.queue.claim('worker') is None
+        self.queue.user_quota = 2
+        self.queue.owner_quota = 10
+        self.queue.enqueue('scan', dict(owner=None))
+        # items without an owner or user have no quota
+        assert json.loads(self.queue.claim('worker').payload) == dict(owner=None)
+        assert self.queue.claim('worker') is None
+
+    def test_sharded_job_counts_once(self):
+        owner = self.add_owner(scan_quota=1)
+        job = ScanJob(
+            root_url='a.com', start_time=datetime.datetime.utcnow(), user=owner.user, owner=owner,
+            status='in progress')
+        db.session.add(job)
+        db.session.commit()
+        shards = [
+            self.queue.enqueue('scan_shard', dict(shard=shard), scan_job_id=job.id, owner_id=owner.id)
+            for shard in range(3)]
+        self.enqueue_for(owner, 1)
+        # the job's shards all run, but the owner's next scan waits for the job
+        assert [self.queue.claim('worker').id for _ in range(3)] == [item.id for item in shards]
+        assert self.queue.claim('worker') is None
+        assert self.queue.running(WorkItem.owner_id, datetime.datetime.utcnow()) == {owner.id: 1}
+
+    def test_requeue(self):
+        self.queue.enqueue('scan', {})
+        item = self.queue.claim('worker-1')
+        assert not self.queue.requeue(item, 'worker-2', 60)
+        assert self.queue.requeue(item, 'worker-1', 60)
+        # the item isn't claimed before its delay is up, and its attempt isn't used up
+        assert self.queue.claim('worker-1') is None
+        item = WorkItem.query.get(item.id)
+        db.session.refresh(item)
+        assert (item.status, item.attempts) == ('queued', 0)
+        item.not_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        db.session.commit()
+        assert self.queue.claim('worker-1').id == item.id
+
+    def test_reclaim_expired_lease(self):
+        self.queue.enqueue('scan', {})
+        item = self.queue.claim('worker-1')
+        assert self.queue.heartbeat(item, 'worker-1')
+        assert self.queue.claim('worker-2') is None
+        self.expire_lease(item)
+        reclaimed = self.queue.claim('worker-2')
+        assert (reclaimed.id, reclaimed.lease_owner, reclaimed.attempts) == (item.id, 'worker-2', 2)
+        # the first worker's heartbeat finds its lease lost
+        assert not self.queue.heartbeat(item, 'worker-1')
+        # with its attempts used up, the item fails rather than being claimed again
+        self.expire_lease(reclaimed)
+        assert self.queue.claim('worker-3') is None
+        assert WorkItem.query.get(item.id).status == 'failed'
+
+    def test_worker_runs_items(self):
+        self.queue.enqueue('ok', dict(n=1))
+        self.queue.enqueue('broken', {})
+        payloads = []
+
+        def broken(payload, item, stopped):
+            raise ValueError('broken item')
+        def again(payload, item, stopped):
+            payloads.append(payload)
+            return 60
+        self.queue.enqueue('again', dict(n=2))
+        worker = Worker(self.queue, dict(
+            ok=lambda payload, item, stopped: payloads.append(payload), broken=broken, again=again))
+        while worker.run_once():
+            pass
+        assert payloads == [dict(n=1), dict(n=2)]
+        items = WorkItem.query.filter(WorkItem.queue == self.queue.name).order_by(WorkItem.id).all()
+        # an item whose handler returns a delay is queued again to run after it
+        assert [item.status for item in items] == ['done', 'failed', 'queued']
+        assert 'broken item' in items[1].error
+        assert items[1].attempts == 2
+        assert items[2].not_before > datetime.datetime.utcnow()
+
+    def test_lost_lease(self):
+        self.queue.enqueue('slow', {})
+        stops = []
+
+        def slow(payload, item, stopped):
+            # another worker claims the item, as if its lease had expired
+            item.lease_owner = 'worker-2'
+            db.session.commit()
+            stops.append(stopped.wait(5))
+            raise ValueError('stopped')
+        worker = Worker(self.queue, dict(slow=slow), name='worker-1', heartbeat_seconds=0.01)
+        assert worker.run_once()
+        # the handler is told to stop, and the item is left to the worker holding its lease
+        assert stops == [True]
+        item = WorkItem.query.filter(WorkItem.queue == self.queue.name).one()
+        db.session.refresh(item)
+        assert (item.status, item.lease_owner, item.error) == ('leased', 'worker-2', None)
+        assert not self.queue.complete(item, 'worker-1')
+        assert self.queue.complete(item, 'worker-2')
+
+    def test_heartbeat_errors_retried(self):
+        self.queue.enqueue('ok', {})
+        beats = []
+        heartbeat = self.queue.heartbeat
+
+        def flaky_heartbeat(item, worker):
+            beats.append(item.id)
+            if len(beats) == 1:
+                raise ValueError('database unavailable')
+            return heartbeat(item, worker)
+        self.queue.heartbeat = flaky_heartbeat
+
+        def ok(payload, item, stopped):
+            while len(beats) < 3:
+                time.sleep(0.01)
+            assert not stopped.is_set()
+        worker = Worker(self.queue, dict(ok=ok), heartbeat_seconds=0.01)
+        assert worker.run_once()
+        item = WorkItem.query.filter(WorkItem.queue == self.queue.name).one()
+        db.session.refresh(item)
+        assert item.status == 'done'
+
+
+def test_acquire_lease():
+    name = 'test-{}'.format(uuid.uuid4())
+    assert acquire_lease(name, 'worker-1')
+    assert acquire_lease(name, 'worker-1')
+    assert not acquire_lease(name, 'worker-2')
+    # an expired lease is taken over
+    lease = Lease.query.get(name)
+    lease.expires = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.commit()
+    assert acquire_lease(name, 'worker-2')
+    assert not acquire_lease(name, 'worker-1')
+
+
+def test_scheduler_leader():
+    lease = 'test-{}'.format(uuid.uuid4())
+    schedulers = [MagicMock(), MagicMock()]
+    leaders = [SchedulerLeader(scheduler, 'worker-{}'.format(i), lease) for i, scheduler in enumerate(schedulers)]
+    assert leaders[0].run_once()
+    assert not leaders[1].run_once()
+    schedulers[0].resume.assert_called_once_with()
+    schedulers[1].resume.assert_not_called()
+    # the leader wakes its scheduler to pick up jobs stored by other processes
+    assert leaders[0].run_once()
+    schedulers[0].scheduler.wakeup.assert_called_once_with()
+
+    # the other worker takes over once the leader's lease expires
+    Lease.query.get(lease).expires = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.session.commit()
+    assert leaders[1].run_once()
+    assert not leaders[0].run_once()
+    schedulers[1].resume.assert_called_once_with()
+    schedulers[0].pause.assert_called_once_with()
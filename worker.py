@@ -0,0 +1,32 @@
+"""Scan worker process: runs the scheduler and the scans queued in the database
+work queue, so that web processes only store and queue them"""
+import argparse
+import os
+import threading
+
+# this process runs the scheduler's jobs only while it leads the workers
+os.environ['RUN_SCHEDULER'] = 'false'
+
+from app import scheduler
+from app.api import work_handlers, schedule_resume_stale_scans
+from app.work_queue import WorkQueue, Worker, SchedulerLeader
+from app.globals import WORK_QUEUE, WORKER_THREADS
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run scheduled and queued scans')
+    parser.add_argument(
+        '-q', '--queue',
+        type=str, help='Work queue name', default=WORK_QUEUE)
+    parser.add_argument(
+        '-t', '--threads',
+        type=int, help='Scans to run at once', default=WORKER_THREADS)
+    parser.add_argument(
+        '--no-scheduler',
+        action='store_true', help='Only run queued scans, never the scheduler')
+    args = parser.parse_args()
+    if not args.no_scheduler:
+        schedule_resume_stale_scans()
+        leader = SchedulerLeader(scheduler)
+        threading.Thread(target=leader.run, daemon=True).start()
+    Worker(WorkQueue(args.queue), work_handlers, threads=args.threads).run()